@@ -1,75 +1,776 @@
 import os
+import re
+import json
+import time
+import random
+import secrets
+import hashlib
+import threading
+import contextvars
 import logging
-from flask import Flask, request, jsonify
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional, Tuple
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context, url_for
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 
 from .story_engine import (
     CATEGORIES_PUBLIC,
+    DEFAULT_STORY_REQUEST,
+    GENERATION_STRATEGIES,
+    detect_category,
+    determine_age_bracket,
     generate_story_api,
+    generate_story_strategy,
+    generate_story_stream,
+    llm_policy,
+    REVISION_MODES,
     revise_story_api,
+    revise_story_incremental,
+    split_paragraphs,
 )
 from .tts_engine import (
+    synthesizer,
+    tts_policy,
     tts_available,
-    synthesize_to_data_url,  # returns data:audio/mpeg;base64,...
+    tts_cache_stats,
+    start_synthesis,  # returns an audio id served by /api/audio/<id>
+    start_pipelined_synthesis,
+    synthesize_story_mp3,
+    publish_audio,
+    open_audio,
+    is_audio_id,
+    audio_shared,
+    audio_profile,
+    audio_format,
+    encode_audio,
 )
+from . import metrics
+from .story_pool import StoryPool
+from .story_cache import StoryCache, normalize_prompt
+from .scheduler import Overloaded, StoryScheduler
+from .resilience import CircuitOpen
+from .quotas import ClientQuotas, QuotaExceeded
+from .batch import BatchRun, AUDIO_DIR, normalize_jobs, read_results
+from .story_store import StorySession, StoryVersion, make_story_store
+from .job_store import Job, make_job_store
+from .tts_cache import audio_key
+from .audio_profiles import ACCEPT_MIMETYPES, PROFILES
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": os.getenv("FRONTEND_ORIGIN", "*")}})
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)  # absolute audio URLs behind Render's proxy
+CORS(app, resources={r"/api/*": {"origins": os.getenv("FRONTEND_ORIGIN", "*")}}, expose_headers=["Server-Timing", "Retry-After"])
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 log = logging.getLogger("api")
 
+AUDIO_WAIT_SECONDS = float(os.getenv("AUDIO_WAIT_SECONDS", "90"))
+TTS_PIPELINE = os.getenv("TTS_PIPELINE", "1") == "1"  # overlap TTS with the judge pass by default
+GENERATION_STRATEGY = os.getenv("GENERATION_STRATEGY", "two-pass")  # default for requests without "strategy"
+REVISION_MODE = os.getenv("REVISION_MODE", "patch")  # "patch" edits paragraphs in place; "full" rewrites
+
+# --- Warm story pool for prompt-less clicks (STORY_POOL_DEPTH stories per category × age bracket) ---
+STORY_POOL_DEPTH = int(os.getenv("STORY_POOL_DEPTH", "0"))
+story_pool = StoryPool(
+    CATEGORIES_PUBLIC,
+    generate=lambda category, age_bracket: generate_story_api(DEFAULT_STORY_REQUEST, age_bracket, category)[0],
+    synthesize=synthesize_story_mp3 if tts_available() else None,
+    depth=STORY_POOL_DEPTH,
+    max_serves=int(os.getenv("STORY_POOL_MAX_SERVES", "3")),
+)
+if STORY_POOL_DEPTH > 0:
+    story_pool.start()
+
+# --- Near-duplicate story cache for custom prompts (opt-in via STORY_CACHE=1) ---
+STORY_CACHE = os.getenv("STORY_CACHE", "0") == "1"
+story_cache = StoryCache(
+    threshold=float(os.getenv("STORY_CACHE_THRESHOLD", "0.7")),
+    ttl_seconds=float(os.getenv("STORY_CACHE_TTL", "86400")),
+    max_entries=int(os.getenv("STORY_CACHE_MAX_ENTRIES", "500")),
+    max_hits=int(os.getenv("STORY_CACHE_MAX_HITS", "0")),
+)
+
+# --- Story sessions: versions, paragraph split and audio id under a storyId (STORY_STORE=memory|sqlite) ---
+story_store = make_story_store(
+    os.getenv("STORY_STORE", "memory"),
+    path=os.getenv("STORY_STORE_PATH", "/tmp/bedtime-stories.db"),
+    max_sessions=int(os.getenv("STORY_STORE_MAX_SESSIONS", "1000")),
+    max_versions=int(os.getenv("STORY_STORE_MAX_VERSIONS", "20")),
+    ttl_seconds=float(os.getenv("STORY_STORE_TTL", "86400")),
+)
+
+# --- Admission control: coalesce identical in-flight generates, cap concurrent pipelines, 429 when full ---
+scheduler = StoryScheduler(
+    max_active=int(os.getenv("GENERATE_MAX_ACTIVE", "4")),
+    max_queue=int(os.getenv("GENERATE_MAX_QUEUE", "16")),
+    queue_timeout=float(os.getenv("GENERATE_QUEUE_TIMEOUT", "30")),
+    max_queue_per_client=int(os.getenv("GENERATE_MAX_QUEUE_PER_CLIENT", "4")),
+)
+
+def coalesce_key(prompt: str, category: str, age_bracket: str, strategy: str, fresh: bool = False, *extra) -> Optional[tuple]:
+    """Requests with the same key while one is in flight share its story; `fresh` opts out."""
+    if fresh:
+        return None
+    return (normalize_prompt(prompt), category, determine_age_bracket(age_bracket), strategy) + extra
+
+def overloaded_response(e, status: int = 429):
+    """429 for our own admission control (Overloaded, QuotaExceeded); 503 when an upstream breaker is open (CircuitOpen)."""
+    response = jsonify({"error": str(e), "retryAfter": e.retry_after})
+    response.status_code = status
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+# --- Per-client quotas: model tokens and TTS characters per hour, per API key or IP (0 = count only) ---
+API_KEYS = {key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()}
+quotas = ClientQuotas(
+    limits={"tokens": float(os.getenv("QUOTA_TOKENS_PER_HOUR", "0")),
+            "ttsChars": float(os.getenv("QUOTA_TTS_CHARS_PER_HOUR", "0"))},
+    bursts={"tokens": float(os.getenv("QUOTA_TOKENS_BURST", "0")),  # 0 = a quarter of the hourly limit
+            "ttsChars": float(os.getenv("QUOTA_TTS_CHARS_BURST", "0"))},
+    max_clients=int(os.getenv("QUOTA_MAX_CLIENTS", "10000")),
+)
+METERED_ENDPOINTS = {"api_generate", "api_generate_stream", "api_generate_batch", "api_revise", "api_create_job"}
+
+def quota_key(api_key: Optional[str], address: Optional[str]) -> str:
+    """Who usage is charged to: a configured API key, else the caller's IP (X-Client-Id is self-chosen)."""
+    if api_key and api_key in API_KEYS:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return "ip:" + (address or "unknown")
+
+# --- Batch generation: background runs written to BATCH_OUTPUT_DIR/<batchId> (see api/batch.py) ---
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "/tmp/bedtime-batches")
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "200"))
+BATCH_MAX_RUNNING = int(os.getenv("BATCH_MAX_RUNNING", "1"))  # per worker
+BATCH_LLM_WORKERS = int(os.getenv("BATCH_LLM_WORKERS", "2"))
+BATCH_TTS_WORKERS = int(os.getenv("BATCH_TTS_WORKERS", "2"))
+_batches: Dict[str, BatchRun] = {}
+_batches_lock = threading.Lock()
+
+# --- Story jobs: POST /api/jobs returns at once; JOB_WORKERS threads per worker run story + TTS (JOB_STORE=memory|sqlite) ---
+job_store = make_job_store(
+    os.getenv("JOB_STORE", "memory"),
+    path=os.getenv("JOB_STORE_PATH", "/tmp/bedtime-jobs.db"),
+    ttl_seconds=float(os.getenv("JOB_TTL", "3600")),
+)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "32"))  # queued + running per worker, then 429
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "25"))  # longest ?wait= long-poll, under the proxy's idle timeout
+_job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_jobs_pending = 0
+_jobs_lock = threading.Lock()
+
 if not os.getenv("OPENAI_API_KEY"):
     log.warning("OPENAI_API_KEY is not set; calls to OpenAI will fail.")
 
+# --- Instrumentation: per-route latency histograms and a Server-Timing breakdown on every response ---
+@app.before_request
+def _start_timing():
+    g.started = time.perf_counter()
+    g.timings = metrics.begin_request()
+
+@app.before_request
+def _meter_usage():
+    """Refuse metered calls from clients over quota; charge the tokens and TTS characters they spend."""
+    g.quota_client = quota_key(request.headers.get("X-Api-Key"), request.remote_addr)
+    if request.endpoint not in METERED_ENDPOINTS:
+        metrics.bind_usage(None)  # worker threads are reused; don't charge the previous caller
+        return None
+    try:
+        quotas.admit(g.quota_client)
+    except QuotaExceeded as e:
+        return overloaded_response(e)
+    metrics.bind_usage(partial(quotas.charge, g.quota_client))
+    return None
+
+@app.after_request
+def _record_timing(response):
+    started = g.get("started")
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.http_seconds.observe(total, route=route, method=request.method)
+    metrics.http_requests.inc(route=route, method=request.method, status=response.status_code)
+    response.headers["Server-Timing"] = metrics.server_timing(g.timings, total)
+    response.headers["Timing-Allow-Origin"] = os.getenv("FRONTEND_ORIGIN", "*")
+    return response
+
+def breaker_stats() -> dict:
+    return {"openai": llm_policy.breaker.stats(), "tts": tts_policy.breaker.stats()}
+
+@app.get("/api/metrics")
+def api_metrics():
+    """Prometheus text format; metrics are per worker process."""
+    extra = metrics.gauge_lines("bedtime_tts_cache", "Audio cache counters and size.", tts_cache_stats())
+    extra += metrics.gauge_lines("bedtime_story_pool", "Warm story pool counters.", story_pool.stats())
+    extra += metrics.gauge_lines("bedtime_scheduler", "Generate admission control: slots, queue, coalesced, rejected.", scheduler.stats())
+    extra += metrics.gauge_lines("bedtime_quotas", "Per-client quotas: tracked clients, rejections, usage totals.", quotas.stats())
+    if STORY_CACHE:
+        extra += metrics.gauge_lines("bedtime_story_cache", "Near-duplicate story cache counters.", story_cache.stats())
+    extra += metrics.gauge_lines("bedtime_breaker_open", "1 while an upstream's circuit breaker is open.",
+                                 {name: int(state["state"] == "open") for name, state in breaker_stats().items()}, label="upstream")
+    return Response(metrics.render(extra), mimetype="text/plain; version=0.0.4")
+
 @app.get("/api/health")
 def health():
     return jsonify({
         "ok": True,
         "tts": tts_available(),
+        "ttsBackend": synthesizer.name,
+        "ttsCache": tts_cache_stats(),
+        "storyPool": story_pool.stats(),
+        "storyCache": story_cache.stats() if STORY_CACHE else None,
+        "storyStore": story_store.stats(),
+        "jobs": job_store.stats(),
+        "scheduler": scheduler.stats(),
+        "quotas": quotas.stats(),
+        "breakers": breaker_stats(),
         "python": os.getenv("PYTHON_VERSION", "3.x"),
     })
 
+def client_id() -> str:
+    """Identify the caller: an explicit X-Client-Id header, else the (proxy-resolved) IP."""
+    return request.headers.get("X-Client-Id") or request.remote_addr or "anonymous"
+
+def tts_allowed(client: str) -> bool:
+    """TTS is up and the client has narration allowance left; otherwise stories go out text-only."""
+    return tts_available() and quotas.allows(client, "ttsChars")
+
+def take_pooled_story(prompt: str, category: Optional[str], age_bracket: str, client: str) -> Optional[dict]:
+    """Serve a prompt-less request from the warm pool: {"story", "category", "audioId"} or None."""
+    if STORY_POOL_DEPTH <= 0 or prompt:
+        return None
+    entry = story_pool.take(category or random.choice(CATEGORIES_PUBLIC), determine_age_bracket(age_bracket), client)
+    if entry is None:
+        return None
+    audio_id = publish_audio(entry.story, entry.audio) if entry.audio else start_synthesis(entry.story)
+    return {"story": entry.story, "category": entry.category, "audioId": audio_id, "path": "pool"}
+
+def lookup_cached_story(prompt: str, category: str, age_bracket: str, fresh: bool = False) -> Optional[dict]:
+    """Serve a custom prompt from a stored near-duplicate: {"story", "category", "audioId"} or None."""
+    if not STORY_CACHE or not prompt or fresh:
+        return None
+    entry = story_cache.get(prompt, category, determine_age_bracket(age_bracket))
+    if entry is None:
+        return None
+    return {"story": entry.story, "category": entry.category, "audioId": start_synthesis(entry.story), "path": "cache"}
+
+def remember_story(prompt: str, category: str, age_bracket: str, story: str) -> None:
+    if STORY_CACHE and prompt:
+        story_cache.put(prompt, category, determine_age_bracket(age_bracket), story)
+
+def ready_story(prompt: str, category: str, age_bracket: str, client: str, fresh: bool = False) -> Optional[dict]:
+    """A story that needs no model call: warm pool for prompt-less clicks, story cache for custom prompts."""
+    return take_pooled_story(prompt, category, age_bracket, client) or lookup_cached_story(prompt, category, age_bracket, fresh)
+
+def open_session(story: str, category: str, age_bracket: str) -> str:
+    """Store a freshly served story as version 1 of a new session and return its storyId."""
+    audio_id = audio_key(story) if tts_available() else None  # same id start_synthesis hands out
+    first = StoryVersion(1, story, split_paragraphs(story), audio_id)
+    return story_store.create(first, category, determine_age_bracket(age_bracket))
+
+def revision_base(data: dict) -> Tuple[Optional[StorySession], Optional[StoryVersion]]:
+    """
+    The session and version a /api/revise call edits: `storyId` (+ optional `version`, default
+    latest). (None, None) for stateless calls that send the full `story`; LookupError when the
+    storyId is unknown or expired and no story text was sent as a fallback.
+    """
+    story_id = data.get("storyId")
+    session = story_store.get(story_id) if story_id else None
+    if session is None:
+        if story_id and not data.get("story"):
+            raise LookupError("Story not found or expired; send 'story' to start a new session.")
+        return None, None
+    wanted = data.get("version")
+    base = next((v for v in session.versions if v.version == wanted), None) if wanted else session.latest
+    if base is None:
+        raise LookupError(f"Story has no version {wanted}.")
+    return session, base
+
+def revision_age_bracket(data: dict, session: Optional[StorySession]) -> str:
+    """The bracket a revision is written for: the session's, else the request's `ageBracket`."""
+    return session.age_bracket if session else determine_age_bracket(data.get("ageBracket") or "middle")
+
+def record_revision(data: dict, session: Optional[StorySession], base: Optional[StoryVersion],
+                    story: str, revised: str, feedback: str, info: dict) -> Tuple[str, int]:
+    """Append the revised text as a new version (opening a session for stateless calls)."""
+    if session is None:
+        story_id = open_session(story, data.get("category") or "", data.get("ageBracket") or "middle")
+        parent = 1
+    else:
+        story_id, parent = session.story_id, base.version
+    audio_id = audio_key(revised) if tts_available() else None
+    version = StoryVersion(0, revised, split_paragraphs(revised), audio_id, feedback, {**info, "parent": parent})
+    added = story_store.append(story_id, version)
+    return story_id, added.version if added else parent
+
+def _ready_response(ready: dict, age_bracket: str) -> dict:
+    return {"story": ready["story"], "category": ready["category"], "audioUrl": _audio_link(ready["audioId"]),
+            "path": ready["path"], "storyId": open_session(ready["story"], ready["category"], age_bracket)}
+
+def audio_format_error(data: dict) -> Optional[str]:
+    try:
+        audio_profile(data.get("audioFormat"))
+    except ValueError as e:
+        return str(e)
+    return None
+
+def _audio_link(audio_id: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    """Absolute URL for a clip in the caller's profile: `requested`, the body's audioFormat, else Accept."""
+    if not audio_id:
+        return None
+    if requested is None:
+        requested = (request.get_json(force=True, silent=True) or {}).get("audioFormat")
+    fmt = audio_format(audio_id, requested, request.accept_mimetypes.best_match(ACCEPT_MIMETYPES))
+    return url_for("get_audio", audio_id=audio_id, format=fmt, _external=True)
+
+def _audio_url(text: str) -> Optional[str]:
+    return _audio_link(start_synthesis(text) if tts_allowed(g.quota_client) else None)
+
+@app.get("/api/audio/<audio_id>")
+def get_audio(audio_id):
+    """
+    Serve story audio. The bare URL is always the clip as synthesized: while synthesis is still
+    running, a request from the start streams it as it is produced. `?format=speech|opus` is
+    that profile, transcoded once the clip is finished, then cached. Finished clips get full
+    Range support. The URLs handed out pick the format (see tts_engine.audio_format).
+    """
+    requested = request.args.get("format")
+    try:
+        profile = audio_profile(requested) if requested else PROFILES["original"]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    clip = open_audio(audio_id)
+    if clip is None:
+        if is_audio_id(audio_id) and not audio_shared():
+            # Without TTS_CACHE_DIR an in-flight clip lives only in the worker that started it.
+            return jsonify({"error": "Audio is not available on this worker yet."}), 503, {"Retry-After": "1"}
+        return jsonify({"error": "Audio not found."}), 404
+
+    byte_range = request.range
+    if not clip.done and not profile.ffmpeg_args and (byte_range is None or byte_range.ranges[0][0] == 0):
+        return Response(
+            stream_with_context(clip.iter_chunks(timeout=AUDIO_WAIT_SECONDS)),
+            mimetype="audio/mpeg",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    if not clip.wait(timeout=AUDIO_WAIT_SECONDS):
+        return jsonify({"error": "Audio is still being generated."}), 503
+    if clip.error is not None:
+        return jsonify({"error": str(clip.error)}), 500
+    audio_bytes, profile = encode_audio(audio_id, clip.getvalue(), profile)
+    return send_file(
+        BytesIO(audio_bytes),
+        mimetype=profile.mimetype,
+        conditional=True,
+        etag=f"{audio_id}-{profile.name}",
+        max_age=86400,
+    )
+
 @app.get("/api/categories")
 def list_categories():
     return jsonify({"categories": CATEGORIES_PUBLIC})
 
+def _story_then_audio(user_request: str, age_bracket: str, category: Optional[str], strategy: str):
+    """generate_story_stream events; TTS starts once the final story is complete."""
+    for event, payload in generate_story_stream(user_request, age_bracket, category, strategy):
+        if event == "story":
+            yield "stage", {"stage": "tts"}
+            payload = {**payload, "audioUrl": _audio_url(payload["story"])}
+        yield event, payload
+
+def _story_with_pipelined_audio(user_request: str, age_bracket: str, category: Optional[str], strategy: str):
+    """
+    generate_story_stream events with TTS overlapped: each paragraph of the final story is
+    synthesized as soon as it ends. Emits an `audio` event with the clip URL before the first delta;
+    the final `story` payload also carries the clip's audioId, so coalesced callers can link it in their own format.
+    """
+    synth = None
+    try:
+        synth = start_pipelined_synthesis() if tts_allowed(g.quota_client) else None
+        audio_url = _audio_link(synth.audio_id) if synth else None
+        announced = False
+        for event, payload in generate_story_stream(user_request, age_bracket, category, strategy):
+            if event == "delta" and synth:
+                if not announced:
+                    announced = True
+                    yield "audio", {"audioUrl": audio_url}
+                synth.feed(payload["text"])
+            if event == "story":
+                if synth:
+                    synth.close()
+                payload = {**payload, "audioUrl": audio_url, "audioId": synth.audio_id if synth else None}
+            yield event, payload
+    except BaseException:
+        if synth:
+            synth.abort(RuntimeError("Story generation was interrupted."))
+        raise
+
+def _strategy(data: dict) -> str:
+    return (data.get("strategy") or GENERATION_STRATEGY).strip().lower()
+
+def _revision_mode(data: dict) -> str:
+    return (data.get("mode") or REVISION_MODE).strip().lower()
+
+def _wants_pipeline(data: dict) -> bool:
+    pipeline = data.get("pipeline")
+    return TTS_PIPELINE if pipeline is None else bool(pipeline)
+
 @app.post("/api/generate")
 def api_generate():
     try:
         data = request.get_json(force=True) or {}
         age_bracket = (data.get("ageBracket") or "middle").strip().lower()
         prompt = (data.get("prompt") or "").strip()
-        category = (data.get("category") or None)
+        user_request = prompt if prompt else DEFAULT_STORY_REQUEST
+        category = (data.get("category") or None) or detect_category(user_request)
+        strategy = _strategy(data)
+        if strategy not in GENERATION_STRATEGIES:
+            return jsonify({"error": f"Unknown strategy '{strategy}'. Use one of: {', '.join(GENERATION_STRATEGIES)}."}), 400
+        error = audio_format_error(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        fresh = bool(data.get("fresh"))
+        ready = ready_story(prompt, category, age_bracket, client_id(), fresh=fresh)
+        if ready:
+            return jsonify(_ready_response(ready, age_bracket))
+
+        if _wants_pipeline(data):
+            def pipelined() -> dict:
+                result = {}
+                for event, payload in _story_with_pipelined_audio(user_request, age_bracket, category, strategy):
+                    if event == "story":
+                        result = payload
+                remember_story(prompt, category, age_bracket, result["story"])
+                return result
+
+            result = scheduler.run(coalesce_key(prompt, category, age_bracket, strategy, fresh, "pipeline"), pipelined,
+                                   client=g.quota_client)
+            # The result is shared by every coalesced caller; each gets the clip in the format it negotiated.
+            body = {key: value for key, value in result.items() if key != "audioId"}
+            return jsonify({**body, "audioUrl": _audio_link(result.get("audioId")),
+                            "storyId": open_session(result["story"], result["category"], age_bracket)})
 
-        story, chosen_category = generate_story_api(
-            user_request=prompt if prompt else "Tell me a fun and imaginative story for a child.",
-            age_bracket=age_bracket,
-            category=category,
+        story, chosen_category, info = scheduler.run(
+            coalesce_key(prompt, category, age_bracket, strategy, fresh),
+            lambda: generate_story_strategy(
+                user_request=user_request,
+                age_bracket=age_bracket,
+                category=category,
+                strategy=strategy,
+            ),
+            client=g.quota_client,
         )
-        audio_data_url = synthesize_to_data_url(story)
-        return jsonify({"story": story, "category": chosen_category, "audioUrl": audio_data_url})
+        remember_story(prompt, chosen_category, age_bracket, story)
+        story_id = open_session(story, chosen_category, age_bracket)
+        return jsonify({"story": story, "category": chosen_category, "audioUrl": _audio_url(story), "storyId": story_id, **info})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except CircuitOpen as e:
+        return overloaded_response(e, 503)
     except Exception as e:
         log.exception("Error in /api/generate")
         return jsonify({"error": str(e)}), 500
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/generate/stream")
+def api_generate_stream():
+    """
+    Server-Sent Events variant of /api/generate. Emits `stage` (drafting/judging/tts),
+    `delta` (judged story tokens), `audio` (pipelined mode: playable URL while judging),
+    then `done` with story, category, audioUrl and serverTiming (or `error`).
+    """
+    data = request.get_json(force=True) or {}
+    age_bracket = (data.get("ageBracket") or "middle").strip().lower()
+    prompt = (data.get("prompt") or "").strip()
+    user_request = prompt if prompt else DEFAULT_STORY_REQUEST
+    category = (data.get("category") or None) or detect_category(user_request)
+    strategy = _strategy(data)
+    if strategy not in GENERATION_STRATEGIES:
+        return jsonify({"error": f"Unknown strategy '{strategy}'. Use one of: {', '.join(GENERATION_STRATEGIES)}."}), 400
+    error = audio_format_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+    if scheduler.full():
+        return overloaded_response(Overloaded(scheduler.retry_after()))
+    source = _story_with_pipelined_audio if _wants_pipeline(data) else _story_then_audio
+    client = client_id()
+    fresh = bool(data.get("fresh"))
+    timings = g.timings  # the Server-Timing header goes out before the body; `done` repeats the breakdown
+
+    def events():
+        try:
+            ready = ready_story(prompt, category, age_bracket, client, fresh=fresh)
+            if ready:
+                yield _sse("done", _ready_response(ready, age_bracket))
+                return
+            with scheduler.slot(g.quota_client):  # streams hold a slot but aren't coalesced
+                for event, payload in source(user_request, age_bracket, category, strategy):
+                    if event == "story":
+                        remember_story(prompt, category, age_bracket, payload["story"])
+                        payload = {**payload, "storyId": open_session(payload["story"], payload["category"], age_bracket),
+                                   "serverTiming": metrics.server_timing(timings)}
+                        payload.pop("audioId", None)
+                    yield _sse("done" if event == "story" else event, payload)
+        except (Overloaded, CircuitOpen) as e:
+            yield _sse("error", {"error": str(e), "retryAfter": e.retry_after})
+        except Exception as e:
+            log.exception("Error in /api/generate/stream")
+            yield _sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _batch_dir(batch_id: str) -> Optional[str]:
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", batch_id or ""):
+        return None
+    path = os.path.join(BATCH_OUTPUT_DIR, batch_id)
+    return path if os.path.isdir(path) else None
+
+@app.post("/api/generate/batch")
+def api_generate_batch():
+    """
+    Start (or, with an existing `batchId`, resume) a batch of {prompt, category, ageBracket, count}
+    jobs. Runs in the background with bounded LLM/TTS parallelism; poll the returned statusUrl.
+    """
+    try:
+        data = request.get_json(force=True) or {}
+        strategy = _strategy(data)
+        if strategy not in GENERATION_STRATEGIES:
+            return jsonify({"error": f"Unknown strategy '{strategy}'. Use one of: {', '.join(GENERATION_STRATEGIES)}."}), 400
+        batch_id = data.get("batchId")
+        if batch_id:
+            out_dir = _batch_dir(batch_id)
+            if out_dir is None:
+                return jsonify({"error": "Batch not found."}), 404
+            jobs = None
+        else:
+            try:
+                jobs = normalize_jobs(data.get("jobs") or [], max_jobs=BATCH_MAX_JOBS)
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+            if not jobs:
+                return jsonify({"error": "Missing 'jobs' in request."}), 400
+            batch_id = secrets.token_urlsafe(9)
+            out_dir = os.path.join(BATCH_OUTPUT_DIR, batch_id)
+
+        with _batches_lock:
+            if batch_id in _batches and _batches[batch_id].running:
+                return jsonify({"error": "Batch is already running."}), 409
+            if sum(1 for run in _batches.values() if run.running) >= BATCH_MAX_RUNNING:
+                return overloaded_response(Overloaded(60))
+            run = BatchRun(
+                out_dir, jobs, strategy=strategy, llm_workers=BATCH_LLM_WORKERS, tts_workers=BATCH_TTS_WORKERS,
+                audio=data.get("audio", True) is not False, synthesize=synthesize_story_mp3 if tts_available() else None,
+            )
+            run.running = True  # before the thread starts, so a quick poll doesn't report it idle
+            _batches[batch_id] = run
+        # The run thread inherits this request's context, so the batch's usage is charged to its caller.
+        threading.Thread(target=contextvars.copy_context().run, args=(run.run,), name=f"batch-{batch_id}", daemon=True).start()
+        status_url = url_for("get_batch", batch_id=batch_id, _external=True)
+        return jsonify({"batchId": batch_id, "statusUrl": status_url, "total": len(run.jobs)}), 202
+    except Exception as e:
+        log.exception("Error in /api/generate/batch")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/generate/batch/<batch_id>")
+def get_batch(batch_id):
+    """Progress plus every finished story; audio is served from the run directory."""
+    out_dir = _batch_dir(batch_id)
+    if out_dir is None:
+        return jsonify({"error": "Batch not found."}), 404
+    run = _batches.get(batch_id) or BatchRun(out_dir)  # started by another worker or before a restart
+    done = read_results(out_dir)
+    results = []
+    for job in run.jobs:
+        record = done.get(job["id"])
+        if record is None:
+            continue
+        audio_file = record.pop("audioFile", None)
+        audio_url = url_for("get_batch_audio", batch_id=batch_id, job_id=job["id"], _external=True) if audio_file else None
+        results.append({**record, "audioUrl": audio_url})
+    return jsonify({"batchId": batch_id, **run.status(), "results": results})
+
+@app.get("/api/generate/batch/<batch_id>/audio/<job_id>")
+def get_batch_audio(batch_id, job_id):
+    out_dir = _batch_dir(batch_id)
+    if out_dir is None or not re.fullmatch(r"[0-9]{4,}-[0-9a-f]{8}", job_id):
+        return jsonify({"error": "Audio not found."}), 404
+    path = os.path.join(out_dir, AUDIO_DIR, f"{job_id}.mp3")
+    if not os.path.exists(path):
+        return jsonify({"error": "Audio not found."}), 404
+    return send_file(path, mimetype="audio/mpeg", conditional=True, max_age=86400)
+
+def _run_job(job_id: str, user_request: str, prompt: str, category: str, age_bracket: str, strategy: str,
+             client: str, quota_client: str) -> None:
+    """Job worker: story (pool, cache or model), then the whole clip, so "done" means playable end to end."""
+    global _jobs_pending
+    try:
+        job_store.update(job_id, status="writing")
+        ready = ready_story(prompt, category, age_bracket, client)
+        if ready:
+            story, chosen_category, audio_id, info = ready["story"], ready["category"], ready["audioId"], {"path": ready["path"]}
+        else:
+            story, chosen_category, info = generate_story_strategy(
+                user_request=user_request, age_bracket=age_bracket, category=category, strategy=strategy,
+            )
+            remember_story(prompt, chosen_category, age_bracket, story)
+            audio_id = None
+        result = {"story": story, "category": chosen_category, "storyId": open_session(story, chosen_category, age_bracket), **info}
+        if audio_id is None and tts_allowed(quota_client):
+            job_store.update(job_id, status="narrating", result=result)  # the text is readable while TTS runs
+            try:
+                audio_id = publish_audio(story, synthesize_story_mp3(story))
+            except Exception:
+                log.exception("TTS failed for job %s; finishing text-only", job_id)
+        elif audio_id is not None:
+            clip = open_audio(audio_id)
+            if clip is not None:
+                clip.wait(timeout=AUDIO_WAIT_SECONDS)  # a cache hit's clip may still be rendering
+        job_store.update(job_id, status="done", result={**result, "audioId": audio_id})
+    except Exception as e:
+        log.exception("Error in job %s", job_id)
+        job_store.update(job_id, status="failed", error=str(e))
+    finally:
+        with _jobs_lock:
+            _jobs_pending -= 1
+
+def _job_response(job: Job) -> dict:
+    body = job.to_json()
+    if body["result"] is not None:
+        result = body["result"] = dict(body["result"])
+        audio_id = result.pop("audioId", None)
+        result["audioUrl"] = _audio_link(audio_id, job.request.get("audioFormat"))
+    return body
+
+@app.post("/api/jobs")
+def api_create_job():
+    """
+    Start a story job with the same body as /api/generate. Returns 202 with `jobId` and
+    `statusUrl` immediately; poll `GET /api/jobs/<jobId>?wait=<seconds>` for the result.
+    """
+    global _jobs_pending
+    try:
+        data = request.get_json(force=True) or {}
+        age_bracket = (data.get("ageBracket") or "middle").strip().lower()
+        prompt = (data.get("prompt") or "").strip()
+        user_request = prompt if prompt else DEFAULT_STORY_REQUEST
+        category = (data.get("category") or None) or detect_category(user_request)
+        strategy = _strategy(data)
+        if strategy not in GENERATION_STRATEGIES:
+            return jsonify({"error": f"Unknown strategy '{strategy}'. Use one of: {', '.join(GENERATION_STRATEGIES)}."}), 400
+        error = audio_format_error(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        with _jobs_lock:
+            if _jobs_pending >= JOB_MAX_PENDING:
+                return overloaded_response(Overloaded(30))
+            _jobs_pending += 1
+        try:
+            job = job_store.create({"prompt": prompt, "category": category, "ageBracket": age_bracket, "strategy": strategy,
+                                    "audioFormat": data.get("audioFormat")})
+            _job_pool.submit(contextvars.copy_context().run, _run_job,  # charged to this request's client
+                             job.job_id, user_request, prompt, category, age_bracket, strategy, client_id(), g.quota_client)
+        except Exception:
+            with _jobs_lock:
+                _jobs_pending -= 1
+            raise
+        status_url = url_for("get_job", job_id=job.job_id, _external=True)
+        return jsonify({"jobId": job.job_id, "status": job.status, "statusUrl": status_url}), 202, {"Location": status_url}
+    except Exception as e:
+        log.exception("Error in /api/jobs")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/jobs/<job_id>")
+def get_job(job_id):
+    """
+    Job status (queued, writing, narrating, done, failed). With `?wait=<seconds>` (capped at
+    JOB_MAX_WAIT) the call long-polls until the job finishes. `result` carries the story from
+    "narrating" on, and `audioUrl` once "done".
+    """
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0.0), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "'wait' must be a number of seconds."}), 400
+    job = job_store.wait(job_id, wait) if wait else job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired."}), 404
+    return jsonify(_job_response(job))
+
 @app.post("/api/revise")
 def api_revise():
+    """
+    Revise a story by `storyId` (server-side session; optional `version`, default latest) or,
+    statelessly, from the full `story` text. Either way the result is stored as a new version.
+    """
     try:
         data = request.get_json(force=True) or {}
-        story = data.get("story")
+        try:
+            session, base = revision_base(data)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        story = base.story if base else data.get("story")
         feedback = (data.get("feedback") or "").strip()
+        mode = _revision_mode(data)
         if not story:
-            return jsonify({"error": "Missing 'story' in request."}), 400
+            return jsonify({"error": "Missing 'storyId' or 'story' in request."}), 400
+        if mode not in REVISION_MODES:
+            return jsonify({"error": f"Unknown mode '{mode}'. Use one of: {', '.join(REVISION_MODES)}."}), 400
+        error = audio_format_error(data)
+        if error:
+            return jsonify({"error": error}), 400
 
-        revised = revise_story_api(story, user_feedback=feedback)
-        audio_data_url = synthesize_to_data_url(revised)
-        return jsonify({"story": revised, "audioUrl": audio_data_url})
+        earlier = session.find_revision(base.version, feedback) if session and feedback else None
+        if earlier and earlier.info.get("mode") in (mode, "full"):
+            revised, info = earlier.story, {"mode": "reused", "version": earlier.version}
+        else:
+            age_bracket = revision_age_bracket(data, session)
+            with scheduler.slot(g.quota_client):
+                if mode == "patch":
+                    paragraphs = base.paragraphs if base else None
+                    revised, info = revise_story_incremental(story, user_feedback=feedback, paragraphs=paragraphs,
+                                                             age_bracket=age_bracket)
+                else:
+                    revised, info = revise_story_api(story, user_feedback=feedback, age_bracket=age_bracket), {"mode": "full"}
+        story_id, version = record_revision(data, session, base, story, revised, feedback, info)
+        return jsonify({"story": revised, "audioUrl": _audio_url(revised), "revision": info,
+                        "storyId": story_id, "version": version})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except CircuitOpen as e:
+        return overloaded_response(e, 503)
     except Exception as e:
         log.exception("Error in /api/revise")
         return jsonify({"error": str(e)}), 500
 
+@app.get("/api/usage")
+def get_usage():
+    """The caller's own usage: requests, model tokens and TTS characters, and what is left of each quota."""
+    return jsonify({"client": g.quota_client, **quotas.usage(g.quota_client)})
+
+@app.get("/api/stories/<story_id>")
+def get_story_session(story_id):
+    session = story_store.get(story_id)
+    if session is None:
+        return jsonify({"error": "Story not found or expired."}), 404
+    return jsonify({
+        "storyId": session.story_id,
+        "category": session.category,
+        "ageBracket": session.age_bracket,
+        "versions": [v.to_json() for v in session.versions],
+    })
+
 # No app.run(); Gunicorn will serve: gunicorn api.app:app
@@ -0,0 +1,282 @@
+"""
+ASGI entry point. /api/generate and /api/revise run on the asyncio engine so many in-flight
+generations share one event loop; every other route falls through to the Flask app.
+
+    uvicorn api.asgi:app --workers 2
+    gunicorn -k uvicorn.workers.UvicornWorker -w 2 -t 120 api.asgi:app
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from functools import partial
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from .app import (
+    app as flask_app,
+    DEFAULT_STORY_REQUEST,
+    GENERATION_STRATEGY,
+    REVISION_MODE,
+    audio_format_error,
+    coalesce_key,
+    open_session,
+    quota_key,
+    quotas,
+    tts_allowed,
+    ready_story,
+    record_revision,
+    remember_story,
+    revision_age_bracket,
+    revision_base,
+)
+from .story_engine import GENERATION_STRATEGIES, REVISION_MODES, detect_category
+from .async_engine import generate_story_strategy_async, revise_story_api_async, revise_story_incremental_async, aclose
+from .tts_engine import audio_format, start_synthesis
+from .audio_profiles import ACCEPT_MIMETYPES
+from . import metrics
+from .scheduler import AsyncStoryScheduler, Overloaded
+from .resilience import CircuitOpen
+from .quotas import QuotaExceeded
+
+log = logging.getLogger("api")
+
+# --- Flask fallthrough: every route not served natively (SSE, audio, job long-polls, batch, health) ---
+# asgiref runs WSGI apps with thread_sensitive=True, i.e. one request at a time per process; a stream
+# or a 90 s audio wait would hold up everything else, /api/health included. They get a thread pool instead.
+_wsgi_pool = ThreadPoolExecutor(max_workers=int(os.getenv("ASGI_WSGI_THREADS", "32")), thread_name_prefix="wsgi")
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    async def run_wsgi_app(self, body):
+        run = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+        await sync_to_async(run, thread_sensitive=False, executor=_wsgi_pool)(self, body)
+
+class _PooledWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+_wsgi = _PooledWsgiToAsgi(flask_app)
+_origin = os.getenv("FRONTEND_ORIGIN", "*")
+
+# One event loop holds many more pipelines than a thread pool, so the async caps are separate and larger.
+scheduler = AsyncStoryScheduler(
+    max_active=int(os.getenv("ASYNC_GENERATE_MAX_ACTIVE", "32")),
+    max_queue=int(os.getenv("ASYNC_GENERATE_MAX_QUEUE", "128")),
+    queue_timeout=float(os.getenv("GENERATE_QUEUE_TIMEOUT", "30")),
+    max_queue_per_client=int(os.getenv("ASYNC_GENERATE_MAX_QUEUE_PER_CLIENT", "16")),
+)
+
+def _header(scope, name: bytes) -> Optional[str]:
+    value = dict(scope.get("headers") or []).get(name)
+    return value.decode("latin-1").split(",")[0].strip() if value else None
+
+def _client_id(scope) -> str:
+    client = scope.get("client")
+    return _header(scope, b"x-client-id") or _header(scope, b"x-forwarded-for") or (client[0] if client else "anonymous")
+
+def _quota_client(scope) -> str:
+    """quota_key for this caller; the address is the proxy's own (rightmost) X-Forwarded-For entry, as ProxyFix uses."""
+    forwarded = dict(scope.get("headers") or []).get(b"x-forwarded-for")
+    client = scope.get("client")
+    address = forwarded.decode("latin-1").split(",")[-1].strip() if forwarded else (client[0] if client else None)
+    return quota_key(_header(scope, b"x-api-key"), address)
+
+def _external_audio_url(scope, audio_id: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    """
+    Absolute /api/audio/<id> URL, honouring X-Forwarded-* like the Flask app's ProxyFix, in the
+    caller's profile (`requested`, else Accept) as the Flask app's _audio_link picks it.
+    """
+    if not audio_id:
+        return None
+    proto = _header(scope, b"x-forwarded-proto") or scope.get("scheme", "http")
+    host = _header(scope, b"x-forwarded-host") or _header(scope, b"host") or "localhost"
+    accept = dict(scope.get("headers") or []).get(b"accept", b"").decode("latin-1")
+    fmt = audio_format(audio_id, requested, parse_accept_header(accept, MIMEAccept).best_match(ACCEPT_MIMETYPES))
+    return f"{proto}://{host}/api/audio/{audio_id}" + (f"?format={fmt}" if fmt else "")
+
+def _audio_url(scope, text: str, requested: Optional[str] = None) -> Optional[str]:
+    audio_id = start_synthesis(text) if tts_allowed(_quota_client(scope)) else None
+    return _external_audio_url(scope, audio_id, requested)
+
+async def _read_json(receive) -> dict:
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    return json.loads(body or b"{}") or {}
+
+async def _send_json(send, payload: dict, status: int = 200, headers: Optional[list] = None) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"access-control-allow-origin", _origin.encode("latin-1")),
+        ] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _send_overloaded(send, e, status: int = 429) -> None:
+    headers = [(b"retry-after", str(e.retry_after).encode("ascii")), (b"access-control-expose-headers", b"Retry-After")]
+    await _send_json(send, {"error": str(e), "retryAfter": e.retry_after}, status, headers)
+
+async def api_generate(scope, receive, send) -> None:
+    try:
+        data = await _read_json(receive)
+        age_bracket = (data.get("ageBracket") or "middle").strip().lower()
+        prompt = (data.get("prompt") or "").strip()
+        user_request = prompt if prompt else DEFAULT_STORY_REQUEST
+        category = (data.get("category") or None) or detect_category(user_request)
+        strategy = (data.get("strategy") or GENERATION_STRATEGY).strip().lower()
+        if strategy not in GENERATION_STRATEGIES:
+            error = f"Unknown strategy '{strategy}'. Use one of: {', '.join(GENERATION_STRATEGIES)}."
+            await _send_json(send, {"error": error}, 400)
+            return
+        error = audio_format_error(data)
+        if error:
+            await _send_json(send, {"error": error}, 400)
+            return
+
+        # Story store, story cache and audio cache lookups hit SQLite and disk: keep them off the event loop.
+        fresh = bool(data.get("fresh"))
+        ready = await asyncio.to_thread(ready_story, prompt, category, age_bracket, _client_id(scope), fresh=fresh)
+        if ready:
+            audio_url = _external_audio_url(scope, ready["audioId"], data.get("audioFormat"))
+            story_id = await asyncio.to_thread(open_session, ready["story"], ready["category"], age_bracket)
+            await _send_json(send, {"story": ready["story"], "category": ready["category"], "audioUrl": audio_url,
+                                    "path": ready["path"], "storyId": story_id})
+            return
+
+        story, chosen_category, info = await scheduler.run(
+            coalesce_key(prompt, category, age_bracket, strategy, fresh),
+            lambda: generate_story_strategy_async(
+                user_request=user_request,
+                age_bracket=age_bracket,
+                category=category,
+                strategy=strategy,
+            ),
+            client=_quota_client(scope),
+        )
+        await asyncio.to_thread(remember_story, prompt, chosen_category, age_bracket, story)
+        story_id = await asyncio.to_thread(open_session, story, chosen_category, age_bracket)
+        audio_url = await asyncio.to_thread(_audio_url, scope, story, data.get("audioFormat"))
+        await _send_json(send, {"story": story, "category": chosen_category, "audioUrl": audio_url,
+                                "storyId": story_id, **info})
+    except Overloaded as e:
+        await _send_overloaded(send, e)
+    except CircuitOpen as e:
+        await _send_overloaded(send, e, 503)
+    except Exception as e:
+        log.exception("Error in /api/generate")
+        await _send_json(send, {"error": str(e)}, 500)
+
+async def api_revise(scope, receive, send) -> None:
+    try:
+        data = await _read_json(receive)
+        try:
+            session, base = await asyncio.to_thread(revision_base, data)
+        except LookupError as e:
+            await _send_json(send, {"error": str(e)}, 404)
+            return
+        story = base.story if base else data.get("story")
+        feedback = (data.get("feedback") or "").strip()
+        mode = (data.get("mode") or REVISION_MODE).strip().lower()
+        if not story:
+            await _send_json(send, {"error": "Missing 'storyId' or 'story' in request."}, 400)
+            return
+        if mode not in REVISION_MODES:
+            await _send_json(send, {"error": f"Unknown mode '{mode}'. Use one of: {', '.join(REVISION_MODES)}."}, 400)
+            return
+        error = audio_format_error(data)
+        if error:
+            await _send_json(send, {"error": error}, 400)
+            return
+
+        earlier = session.find_revision(base.version, feedback) if session and feedback else None
+        if earlier and earlier.info.get("mode") in (mode, "full"):
+            revised, info = earlier.story, {"mode": "reused", "version": earlier.version}
+        elif mode == "patch":
+            paragraphs = base.paragraphs if base else None
+            age_bracket = revision_age_bracket(data, session)
+            revised, info = await scheduler.run(
+                None, lambda: revise_story_incremental_async(story, user_feedback=feedback, paragraphs=paragraphs,
+                                                             age_bracket=age_bracket),
+                client=_quota_client(scope))
+        else:
+            age_bracket = revision_age_bracket(data, session)
+            revised = await scheduler.run(None, lambda: revise_story_api_async(story, user_feedback=feedback, age_bracket=age_bracket),
+                                          client=_quota_client(scope))
+            info = {"mode": "full"}
+        story_id, version = await asyncio.to_thread(record_revision, data, session, base, story, revised, feedback, info)
+        audio_url = await asyncio.to_thread(_audio_url, scope, revised, data.get("audioFormat"))
+        await _send_json(send, {"story": revised, "audioUrl": audio_url, "revision": info,
+                                "storyId": story_id, "version": version})
+    except Overloaded as e:
+        await _send_overloaded(send, e)
+    except CircuitOpen as e:
+        await _send_overloaded(send, e, 503)
+    except Exception as e:
+        log.exception("Error in /api/revise")
+        await _send_json(send, {"error": str(e)}, 500)
+
+ASYNC_ROUTES = {
+    "/api/generate": api_generate,
+    "/api/revise": api_revise,
+}
+
+async def _timed(handler, scope, receive, send) -> None:
+    """Run an async route with the same latency metrics and Server-Timing header as the Flask app."""
+    started = time.perf_counter()
+    timings = metrics.begin_request()
+    path, method = scope["path"], scope["method"]
+
+    async def send_timed(message):
+        if message["type"] == "http.response.start":
+            total = time.perf_counter() - started
+            metrics.http_seconds.observe(total, route=path, method=method)
+            metrics.http_requests.inc(route=path, method=method, status=message["status"])
+            message = {**message, "headers": list(message.get("headers") or []) + [
+                (b"server-timing", metrics.server_timing(timings, total).encode("latin-1")),
+                (b"timing-allow-origin", _origin.encode("latin-1")),
+                (b"access-control-expose-headers", b"Server-Timing"),
+            ]}
+        await send(message)
+
+    client = _quota_client(scope)
+    try:
+        quotas.admit(client)
+    except QuotaExceeded as e:
+        await _send_overloaded(send_timed, e)
+        return
+    metrics.bind_usage(partial(quotas.charge, client))  # per task: each request runs in its own context
+    await handler(scope, receive, send_timed)
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    handler = ASYNC_ROUTES.get(scope.get("path", ""))
+    if scope["type"] == "http" and scope["method"] == "POST" and handler:
+        await _timed(handler, scope, receive, send)
+        return
+    await _wsgi(scope, receive, send)
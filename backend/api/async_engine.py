@@ -0,0 +1,192 @@
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import stage, observe_tokens, observe_estimated_tokens
+from .resilience import DeadlineExceeded
+from .story_engine import (
+    llm_policy,
+    GENERATION_STRATEGIES,
+    detect_category,
+    determine_age_bracket,
+    build_storyteller_prompt,
+    build_single_pass_prompt,
+    build_judge_prompt,
+    check_draft,
+    token_budget,
+    estimate_prompt_tokens,
+    StoryStopper,
+    BEST_OF_N,
+    pick_best_draft,
+    finished_text,
+    split_paragraphs,
+    build_patch_prompt,
+    parse_patch,
+    apply_patch,
+)
+
+# --- Concurrency & pooling knobs ---
+# LLM_MAX_CONCURRENCY caps in-flight OpenAI calls per process; LLM_POOL_SIZE sizes the keep-alive pool.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "100"))
+
+async_client = None  # created on first use, like story_engine.client
+_limiter = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+def get_async_client():
+    global async_client
+    if async_client is None:
+        import httpx
+        from openai import AsyncOpenAI
+        async_client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            max_retries=0,  # llm_policy retries
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+                timeout=httpx.Timeout(120.0, connect=10.0),
+            ),
+        )
+    return async_client
+
+async def call_model_async(messages, temperature=0.7, max_tokens=1600, response_format: Optional[dict] = None,
+                           stage_name: str = "llm") -> str:
+    extra = {"response_format": response_format} if response_format else {}
+    async with _limiter:
+        with stage(stage_name):
+            resp = await llm_policy.acall(lambda timeout: get_async_client().chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                **extra,
+            ))
+    observe_tokens(stage_name, getattr(resp, "usage", None))
+    return resp.choices[0].message.content.strip()
+
+async def call_story_model_async(messages, age_bracket: str, temperature: float = 0.7,
+                                 stage_name: str = "llm") -> Tuple[str, dict]:
+    """Async mirror of story_engine.call_story_model: budgeted, streamed, stops at the closing beat."""
+    budget = token_budget(age_bracket)
+    stopper = StoryStopper(age_bracket, budget)
+    async with _limiter:
+        with stage(stage_name):
+            deadline = time.monotonic() + llm_policy.deadline
+            stream = await llm_policy.acall(lambda timeout: get_async_client().chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                temperature=temperature,
+                max_tokens=budget,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            ), discard=lambda s: s.close(), streaming=True)
+            error = None
+            try:
+                async for chunk in stream:
+                    if time.monotonic() > deadline:
+                        raise DeadlineExceeded(f"openai stream exceeded its {llm_policy.deadline:g}s deadline")
+                    if not chunk.choices:
+                        stopper.usage = getattr(chunk, "usage", None)
+                        observe_tokens(stage_name, stopper.usage)
+                        continue
+                    choice = chunk.choices[0]
+                    if choice.finish_reason:
+                        stopper.finish_reason = choice.finish_reason
+                    if choice.delta.content and stopper.feed(choice.delta.content)[1]:
+                        break
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                await stream.close()
+                llm_policy.stream_finished(error)
+                if stopper.usage is None:  # stopped early, deadline or disconnect: charge an estimate
+                    observe_estimated_tokens(stage_name, estimate_prompt_tokens(messages), stopper.chunks)
+    return stopper.result(), stopper.report()
+
+async def call_model_n_async(messages, n: int, temperature: float = 0.9, max_tokens: int = 1600,
+                             stage_name: str = "drafts") -> Tuple[List[str], dict]:
+    """Async mirror of story_engine.call_model_n."""
+    async with _limiter:
+        with stage(stage_name):
+            resp = await llm_policy.acall(lambda timeout: get_async_client().chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                n=n,
+                timeout=timeout,
+            ))
+    usage = getattr(resp, "usage", None)
+    observe_tokens(stage_name, usage)
+    texts = [finished_text(choice) for choice in resp.choices]
+    return texts, {"maxTokens": max_tokens, "completionTokens": getattr(usage, "completion_tokens", None), "n": n}
+
+async def generate_story_strategy_async(user_request: str, age_bracket: str, category: Optional[str] = None,
+                                        strategy: str = "two-pass") -> Tuple[str, str, dict]:
+    """Async mirror of story_engine.generate_story_strategy."""
+    if strategy not in GENERATION_STRATEGIES:
+        raise ValueError(f"Unknown generation strategy: {strategy}")
+    chosen_category = category or detect_category(user_request)
+    ab = determine_age_bracket(age_bracket)
+    tokens: Dict[str, dict] = {}
+    if strategy == "single-pass":
+        story, tokens["single-pass"] = await call_story_model_async(
+            build_single_pass_prompt(user_request, chosen_category, ab), ab, temperature=0.8, stage_name="single-pass")
+        return story, chosen_category, {"strategy": strategy, "path": "single-pass", "tokens": tokens}
+
+    if strategy == "best-of-n":
+        drafts, tokens["drafts"] = await call_model_n_async(
+            build_storyteller_prompt(user_request, chosen_category, ab), BEST_OF_N, temperature=0.9, max_tokens=token_budget(ab))
+        story, ranking = pick_best_draft(drafts, ab)
+        return story, chosen_category, {"strategy": strategy, "path": "best-of-n", **ranking, "tokens": tokens}
+
+    draft, tokens["draft"] = await call_story_model_async(
+        build_storyteller_prompt(user_request, chosen_category, ab), ab, temperature=0.85, stage_name="draft")
+    if strategy == "judge-if-needed":
+        failed = check_draft(draft, ab)
+        if not failed:
+            return draft, chosen_category, {"strategy": strategy, "path": "draft-only", "checks": [], "tokens": tokens}
+        improved, tokens["judge"] = await call_story_model_async(
+            build_judge_prompt(draft, age_bracket=ab), ab, temperature=0.6, stage_name="judge")
+        return improved, chosen_category, {"strategy": strategy, "path": "draft+judge", "checks": failed, "tokens": tokens}
+
+    improved, tokens["judge"] = await call_story_model_async(
+        build_judge_prompt(draft, age_bracket=ab), ab, temperature=0.6, stage_name="judge")
+    return improved, chosen_category, {"strategy": strategy, "path": "two-pass", "tokens": tokens}
+
+async def generate_story_api_async(user_request: str, age_bracket: str, category: Optional[str] = None) -> Tuple[str, str]:
+    story, chosen_category, _ = await generate_story_strategy_async(user_request, age_bracket, category)
+    return story, chosen_category
+
+async def revise_story_api_async(current_story: str, user_feedback: str, age_bracket: str = "middle") -> str:
+    """Async mirror of story_engine.revise_story_api."""
+    ab = determine_age_bracket(age_bracket)
+    revised, _ = await call_story_model_async(build_judge_prompt(current_story, user_feedback=user_feedback, age_bracket=ab), ab,
+                                              temperature=0.6, stage_name="revise")
+    return revised
+
+async def revise_story_incremental_async(current_story: str, user_feedback: str, paragraphs: Optional[List[str]] = None,
+                                        age_bracket: str = "middle") -> Tuple[str, dict]:
+    """Async mirror of story_engine.revise_story_incremental."""
+    paragraphs = paragraphs or split_paragraphs(current_story)
+    if user_feedback.strip() and paragraphs:
+        raw = await call_model_async(build_patch_prompt(paragraphs, user_feedback), temperature=0.4, max_tokens=900,
+                                     response_format={"type": "json_object"}, stage_name="patch")
+        try:
+            edits = parse_patch(raw, len(paragraphs))
+        except ValueError:
+            edits = None
+        if edits:
+            revised = apply_patch(paragraphs, edits)
+            changed = sorted({e["paragraph"] for e in edits})
+            return "\n\n".join(revised), {"mode": "patch", "editedParagraphs": changed, "paragraphs": len(revised)}
+    revised = await revise_story_api_async(current_story, user_feedback=user_feedback, age_bracket=age_bracket)
+    return revised, {"mode": "full"}
+
+async def aclose() -> None:
+    """Release pooled connections (called on ASGI lifespan shutdown)."""
+    if async_client is not None:
+        await async_client.close()
@@ -0,0 +1,61 @@
+"""
+Audio post-processing profiles. ffmpeg re-encodes a finished MP3 clip as compact mono speech
+audio. It also shortens the long pauses gTTS leaves between sentences and chunks.
+transcode() runs inside tts_engine's process pool, so this module imports only the stdlib.
+
+    original  the synthesized MP3 as is
+    speech    mono 16 kHz MP3 at 24 kbps, pauses trimmed (plays everywhere)
+    opus      mono Opus in Ogg at 16 kbps, pauses trimmed (smallest; not every browser)
+"""
+import shlex
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# Pauses longer than 0.4 s (below -50 dB) are cut to 0.25 s; leading silence is dropped.
+TRIM_SILENCE = ("silenceremove=start_periods=1:start_threshold=-50dB"
+                ":stop_periods=-1:stop_duration=0.4:stop_threshold=-50dB:stop_silence=0.25")
+
+@dataclass(frozen=True)
+class AudioProfile:
+    name: str
+    mimetype: str
+    extension: str
+    ffmpeg_args: Tuple[str, ...] = ()  # output options; empty = no transcoding
+
+PROFILES = {
+    "original": AudioProfile("original", "audio/mpeg", "mp3"),
+    "speech": AudioProfile("speech", "audio/mpeg", "mp3", (
+        "-af", TRIM_SILENCE, "-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", "24k", "-f", "mp3")),
+    "opus": AudioProfile("opus", "audio/ogg", "ogg", (
+        "-af", TRIM_SILENCE, "-ac", "1", "-c:a", "libopus", "-b:a", "16k", "-application", "voip", "-f", "ogg")),
+}
+# Accept types we can answer, for request.accept_mimetypes.best_match(); the first wins on */*.
+ACCEPT_MIMETYPES = ("audio/mpeg", "audio/ogg", "audio/opus")
+OGG_MIMETYPES = ("audio/ogg", "audio/opus")
+
+def choose_profile(requested: Optional[str], accepted: Optional[str], default: str = "speech") -> AudioProfile:
+    """
+    An explicit profile name (?format=) wins. Otherwise an Accept preference for Ogg/Opus
+    selects opus. Otherwise `default`. Unknown names raise ValueError.
+    """
+    name = (requested or "").strip().lower()
+    if not name:
+        name = "opus" if accepted in OGG_MIMETYPES else default
+    if name not in PROFILES:
+        raise ValueError(f"Unknown audio format '{name}'. Use one of: {', '.join(PROFILES)}.")
+    return PROFILES[name]
+
+def installed(ffmpeg: str = "ffmpeg") -> bool:
+    args = shlex.split(ffmpeg or "")
+    return bool(args) and shutil.which(args[0]) is not None
+
+def transcode(data: bytes, ffmpeg_args: Tuple[str, ...], ffmpeg: str = "ffmpeg", timeout: float = 60.0) -> bytes:
+    """Re-encode MP3 bytes with the given ffmpeg output options (stdin -> stdout)."""
+    args = shlex.split(ffmpeg) + ["-loglevel", "error", "-f", "mp3", "-i", "pipe:0", *ffmpeg_args, "pipe:1"]
+    proc = subprocess.run(args, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    if proc.returncode != 0 or not proc.stdout:
+        detail = proc.stderr.decode("utf-8", "replace").strip()[:200]
+        raise RuntimeError(f"{args[0]} exited with {proc.returncode}: {detail or 'no output'}")
+    return proc.stdout
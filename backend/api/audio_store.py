@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional, Tuple
+
+class AudioClip:
+    """
+    A growing MP3 buffer. The synthesizer write()s into it while /api/audio readers
+    iterate chunks as they land; close() or fail() marks the end.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._done = False
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    @classmethod
+    def complete(cls, data: bytes) -> "AudioClip":
+        clip = cls()
+        clip.write(data)
+        clip.close()
+        return clip
+
+    # --- writer side (file-like, so gTTS.write_to_fp can target it) ---
+    def write(self, data: bytes) -> int:
+        with self._cond:
+            self._buf.extend(data)
+            self._cond.notify_all()
+        return len(data)
+
+    def close(self) -> None:
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+
+    def fail(self, error: BaseException) -> None:
+        with self._cond:
+            self.error = error
+            self._done = True
+            self._cond.notify_all()
+
+    # --- reader side ---
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def getvalue(self) -> bytes:
+        with self._cond:
+            return bytes(self._buf)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._done, timeout)
+
+    def iter_chunks(self, timeout: Optional[float] = None) -> Iterator[bytes]:
+        pos = 0
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._done or len(self._buf) > pos, timeout):
+                    raise TimeoutError("Timed out waiting for audio.")
+                chunk = bytes(self._buf[pos:])
+                done, error = self._done, self.error
+            if chunk:
+                pos += len(chunk)
+                yield chunk
+            elif done:
+                if error is not None:
+                    raise RuntimeError(f"Audio synthesis failed: {error}")
+                return
+
+class AudioStore:
+    """Bounded registry of clips by id; oldest clips are dropped once max_clips is exceeded."""
+
+    def __init__(self, max_clips: int = 64):
+        self.max_clips = max_clips
+        self._clips: "OrderedDict[str, AudioClip]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clip_id: str) -> Optional[AudioClip]:
+        with self._lock:
+            clip = self._clips.get(clip_id)
+            if clip is not None:
+                self._clips.move_to_end(clip_id)
+            return clip
+
+    def get_or_create(self, clip_id: str) -> Tuple[AudioClip, bool]:
+        """Return (clip, created). A clip whose synthesis failed is replaced so it can be retried."""
+        with self._lock:
+            clip = self._clips.get(clip_id)
+            if clip is not None and clip.error is None:
+                self._clips.move_to_end(clip_id)
+                return clip, False
+            clip = AudioClip()
+            self._clips[clip_id] = clip
+            self._clips.move_to_end(clip_id)
+            while len(self._clips) > self.max_clips:
+                self._clips.popitem(last=False)
+            return clip, True
@@ -0,0 +1,204 @@
+"""
+Bulk story generation for pre-produced story packs (used by /api/generate/batch and `main.py batch`).
+
+A run directory holds:
+    jobs.json       the normalized job list (so a run can be resumed from the directory alone)
+    stories.jsonl   one record per job, appended as each completes (the checkpoint); with audio on, the
+                    story is appended as soon as it is written ("audioPending") and again once narrated
+    audio/<id>.mp3  narration for each finished job (when audio is on)
+
+Jobs already finished in stories.jsonl are skipped and pending narrations are picked up from their
+saved story, so re-running an interrupted batch resumes it without rewriting anything.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from .story_engine import DEFAULT_STORY_REQUEST, GENERATION_STRATEGIES, detect_category, determine_age_bracket, generate_story_strategy
+from .tts_cache import audio_key
+
+log = logging.getLogger("api")
+
+JOBS_FILE = "jobs.json"
+STORIES_FILE = "stories.jsonl"
+AUDIO_DIR = "audio"
+
+def normalize_jobs(raw_jobs: List[dict], max_jobs: int = 0) -> List[dict]:
+    """
+    Expand {"prompt", "category", "ageBracket", "count"} entries into one job per story, each
+    with a stable id (position + hash of what was asked for) so checkpoints survive a restart; a
+    missing category is resolved here, after the id, since detection may pick at random. With `max_jobs`,
+    a batch that would exceed it is rejected before anything is expanded.
+    """
+    if not isinstance(raw_jobs, list):
+        raise ValueError("'jobs' must be a list of objects.")
+    counts: List[int] = []
+    for entry in raw_jobs:
+        if not isinstance(entry, dict):
+            raise ValueError(f"Each job must be an object, got {entry!r}")
+        try:
+            count = int(entry.get("count") or 1)
+        except (TypeError, ValueError):
+            raise ValueError(f"'count' must be a whole number, got {entry.get('count')!r}")
+        if count < 1:
+            raise ValueError(f"'count' must be at least 1, got {count}")
+        counts.append(count)
+        if max_jobs and sum(counts) > max_jobs:
+            raise ValueError(f"Batch has at least {sum(counts)} stories; the limit is {max_jobs}.")
+    jobs: List[dict] = []
+    for entry, count in zip(raw_jobs, counts):
+        prompt = (entry.get("prompt") or "").strip()
+        requested = entry.get("category") or ""
+        age_bracket = determine_age_bracket(entry.get("ageBracket") or "middle")
+        digest = hashlib.sha1(f"{prompt}\0{requested}\0{age_bracket}".encode("utf-8")).hexdigest()[:8]
+        for _ in range(count):
+            category = requested or detect_category(prompt or DEFAULT_STORY_REQUEST)
+            jobs.append({"id": f"{len(jobs):04d}-{digest}", "prompt": prompt, "category": category, "ageBracket": age_bracket})
+    return jobs
+
+def write_jobs(out_dir: str, jobs: List[dict]) -> None:
+    os.makedirs(os.path.join(out_dir, AUDIO_DIR), exist_ok=True)
+    with open(os.path.join(out_dir, JOBS_FILE), "w", encoding="utf-8") as f:
+        json.dump(jobs, f, indent=1)
+
+def read_jobs(out_dir: str) -> List[dict]:
+    with open(os.path.join(out_dir, JOBS_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+def read_results(out_dir: str) -> Dict[str, dict]:
+    """Finished records by job id; a torn last line from a crash is ignored."""
+    results: Dict[str, dict] = {}
+    path = os.path.join(out_dir, STORIES_FILE)
+    if not os.path.exists(path):
+        return results
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            results[record["id"]] = record
+    return results
+
+class BatchRun:
+    """
+    One batch over a run directory. Story generation runs on `llm_workers` threads and narration
+    on `tts_workers`, so the two stages overlap; each finished job is appended to stories.jsonl.
+    """
+
+    def __init__(self, out_dir: str, jobs: Optional[List[dict]] = None, strategy: str = "two-pass",
+                 llm_workers: int = 4, tts_workers: int = 2, audio: bool = True,
+                 synthesize: Optional[Callable[[str], Optional[bytes]]] = None):
+        if strategy not in GENERATION_STRATEGIES:
+            raise ValueError(f"Unknown generation strategy: {strategy}")
+        self.out_dir = out_dir
+        if jobs is not None and not self._same_jobs(jobs):
+            write_jobs(out_dir, jobs)
+        self.jobs = read_jobs(out_dir)
+        self.strategy = strategy
+        self.llm_workers = llm_workers
+        self.tts_workers = tts_workers
+        self.synthesize = synthesize if audio else None
+        self.errors: Dict[str, str] = {}
+        self.running = False
+        self._write_lock = threading.Lock()
+
+    def _same_jobs(self, jobs: List[dict]) -> bool:
+        """True when `jobs` re-expands the saved list; the saved one (with its resolved categories) is kept."""
+        try:
+            saved = read_jobs(self.out_dir)
+        except (OSError, ValueError):
+            return False
+        return [job["id"] for job in saved] == [job["id"] for job in jobs]
+
+    def status(self) -> dict:
+        done = read_results(self.out_dir)
+        return {
+            "total": len(self.jobs),
+            "completed": sum(1 for job in self.jobs if job["id"] in done and not done[job["id"]].get("audioPending")),
+            "failed": len(self.errors),
+            "running": self.running,
+            "errors": dict(self.errors),
+        }
+
+    def run(self, on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """Run every job not yet finished in stories.jsonl; returns status(). Failed jobs are retried on the next run."""
+        self.running = True
+        self.errors.clear()
+        self._repair_tail()
+        done = read_results(self.out_dir)
+        llm_pool = ThreadPoolExecutor(self.llm_workers, thread_name_prefix="batch-llm")
+        tts_pool = ThreadPoolExecutor(self.tts_workers, thread_name_prefix="batch-tts")
+        try:
+            pending = {}
+            for job in self.jobs:
+                record = done.get(job["id"])
+                if record is None:
+                    pending[llm_pool.submit(self._write_story, job)] = ("llm", job)
+                elif record.get("audioPending") and self.synthesize:
+                    # Written before an interruption or a TTS failure: narrate the saved story.
+                    pending[tts_pool.submit(self._narrate, record)] = ("tts", job)
+                elif record.get("audioPending"):
+                    record.pop("audioPending")
+                    self._checkpoint(record)  # audio is off for this run, so the story alone finishes the job
+                    if on_progress:
+                        on_progress(record)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, job = pending.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        log.warning("Batch job %s failed in %s: %s", job["id"], stage, e)
+                        self.errors[job["id"]] = f"{stage}: {e}"
+                        continue
+                    if stage == "llm" and self.synthesize:
+                        self._checkpoint({**record, "audioPending": True})
+                        pending[tts_pool.submit(self._narrate, record)] = ("tts", job)
+                        continue
+                    self._checkpoint(record)
+                    if on_progress:
+                        on_progress(record)
+        finally:
+            # On Ctrl-C drop queued jobs; only the in-flight ones finish (and are redone on resume).
+            llm_pool.shutdown(cancel_futures=True)
+            tts_pool.shutdown(cancel_futures=True)
+            self.running = False
+        return self.status()
+
+    def _write_story(self, job: dict) -> dict:
+        story, category, info = generate_story_strategy(
+            job["prompt"] or DEFAULT_STORY_REQUEST, job["ageBracket"], job["category"], self.strategy)
+        return {**job, "category": category, "story": story, "words": len(story.split()), **info}
+
+    def _narrate(self, record: dict) -> dict:
+        record = {key: value for key, value in record.items() if key != "audioPending"}
+        audio = self.synthesize(record["story"])
+        if not audio:
+            return record
+        name = f"{record['id']}.mp3"
+        path = os.path.join(self.out_dir, AUDIO_DIR, name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(audio)
+        os.replace(path + ".tmp", path)
+        return {**record, "audioFile": f"{AUDIO_DIR}/{name}", "audioId": audio_key(record["story"])}
+
+    def _repair_tail(self) -> None:
+        """Terminate a line torn by a crash so the next append starts on a fresh line."""
+        path = os.path.join(self.out_dir, STORIES_FILE)
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def _checkpoint(self, record: dict) -> None:
+        with self._write_lock, open(os.path.join(self.out_dir, STORIES_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,79 @@
+"""
+Keep-alive transport for gTTS. gTTS.stream() opens a new requests.Session, and so a new TCP
+and TLS connection, for every ~100-character part of the text. Here gTTS only prepares the
+requests (tokenizing and packaging the text). The parts go out over one connection pool per
+worker, shared by every chunk, request and thread, so a story pays the handshake once.
+
+Sessions are per thread (requests.Session isn't documented as thread-safe). They all mount
+the same HTTPAdapter, whose urllib3 pool is what holds the open connections.
+"""
+import re
+import time
+import base64
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TTS_PATH = "/_/TranslateWebserverUi/data/batchexecute"
+_AUDIO = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+class GTTSTransport:
+    """
+    Sends a gTTS object's requests over pooled connections. `pool_size` connections are kept
+    per host, `connect_timeout` / `read_timeout` bound each part, and `base_url` points the
+    requests at a stand-in server (e.g. bench/mock_gtts.py) instead of translate.google.com.
+    """
+
+    def __init__(self, pool_size: int = 8, connect_timeout: float = 3.05, read_timeout: float = 15.0,
+                 base_url: Optional[str] = None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)  # retries: tts_policy
+        self._local = threading.local()
+
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+        return session
+
+    def synthesize(self, tts, timeout: Optional[float] = None) -> bytes:
+        """MP3 bytes for a gTTS object; `timeout` bounds all of its parts together."""
+        from gtts.tts import gTTSError
+        deadline = time.monotonic() + (timeout or self.read_timeout * 4)
+        session = self.session()
+        audio = bytearray()
+        for prepared in tts._prepare_requests():
+            if self.base_url:
+                prepared.url = self.base_url + TTS_PATH
+            read = min(self.read_timeout, max(0.01, deadline - time.monotonic()))
+            settings = session.merge_environment_settings(prepared.url, {}, None, None, None)  # proxies, CA bundle
+            try:
+                response = session.send(prepared, timeout=(min(self.connect_timeout, read), read), **settings)
+            except requests.exceptions.RequestException as e:
+                raise gTTSError(tts=tts) from e
+            if response.status_code >= 400:
+                raise gTTSError(tts=tts, response=response)
+            audio += _decode(response.text, tts)
+        return bytes(audio)
+
+def _decode(body: str, tts) -> bytes:
+    """The MP3 bytes in a batchexecute response (the parsing gTTS.stream() does)."""
+    from gtts.tts import gTTSError
+    audio = bytearray()
+    for line in body.splitlines():
+        if "jQ1olc" not in line:
+            continue
+        match = _AUDIO.search(line)
+        if match is None:
+            raise gTTSError(tts=tts, msg="No audio stream in response.")
+        audio += base64.b64decode(match.group(1).encode("ascii"))
+    if not audio:
+        raise gTTSError(tts=tts, msg="No audio stream in response.")
+    return bytes(audio)
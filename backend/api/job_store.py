@@ -0,0 +1,155 @@
+import json
+import time
+import secrets
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# queued -> writing -> narrating -> done, or failed from any of them
+FINISHED = ("done", "failed")
+
+@dataclass
+class Job:
+    job_id: str
+    status: str = "queued"
+    request: dict = field(default_factory=dict)
+    result: Optional[dict] = None  # the story arrives with "narrating"; audioId is added at "done"
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_json(self) -> dict:
+        return {"jobId": self.job_id, "status": self.status, "result": self.result, "error": self.error,
+                "created": self.created, "updated": self.updated}
+
+def new_job_id() -> str:
+    return secrets.token_urlsafe(12)
+
+class MemoryJobStore:
+    """In-process jobs (one worker). Finished jobs are dropped `ttl_seconds` after their last update."""
+    kind = "memory"
+
+    def __init__(self, ttl_seconds: float = 3600.0):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._changed = threading.Condition()
+
+    def create(self, request: dict) -> Job:
+        job = Job(new_job_id(), request=request)
+        with self._changed:
+            cutoff = time.time() - self.ttl_seconds
+            for job_id in [j.job_id for j in self._jobs.values() if j.finished and j.updated < cutoff]:
+                del self._jobs[job_id]
+            self._jobs[job.job_id] = job
+        return Job(**vars(job))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._changed:
+            job = self._jobs.get(job_id)
+            return Job(**vars(job)) if job else None  # a snapshot, like the SQLite store returns
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated = time.time()
+            self._changed.notify_all()
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Block until the job finishes or `timeout` passes; returns its latest state."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job.finished or remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+        return self.get(job_id)
+
+    def stats(self) -> dict:
+        with self._changed:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"kind": self.kind, **counts}
+
+class SqliteJobStore:
+    """
+    Jobs in a SQLite file, shared by every worker on the host: any worker can answer
+    GET /api/jobs/<id> for a job another one is running. wait() polls every `poll_seconds`.
+    """
+    kind = "sqlite"
+
+    def __init__(self, path: str, ttl_seconds: float = 3600.0, poll_seconds: float = 0.25):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.poll_seconds = poll_seconds
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY, status TEXT, request TEXT, result TEXT, error TEXT,
+                created REAL, updated REAL)""")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10.0)
+        try:
+            with db:  # commit on success, roll back on error
+                yield db
+        finally:
+            db.close()
+
+    def create(self, request: dict) -> Job:
+        job = Job(new_job_id(), request=request)
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?", (*FINISHED, time.time() - self.ttl_seconds))
+            db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (job.job_id, job.status, json.dumps(request), None, None, job.created, job.updated))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as db:
+            row = db.execute("SELECT job_id, status, request, result, error, created, updated FROM jobs WHERE job_id = ?",
+                             (job_id,)).fetchone()
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), json.loads(row[3]) if row[3] else None, row[4], row[5], row[6])
+
+    def update(self, job_id: str, **fields) -> None:
+        if "request" in fields or "result" in fields:
+            fields = {k: json.dumps(v) if k in ("request", "result") and v is not None else v for k, v in fields.items()}
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as db:
+            db.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job.finished or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(self.poll_seconds, max(0.0, deadline - time.monotonic())))
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"kind": self.kind, **{status: count for status, count in rows}}
+
+def make_job_store(kind: str = "memory", path: str = "jobs.db", ttl_seconds: float = 3600.0):
+    """JOB_STORE=memory (per worker) or sqlite (shared across workers on one host)."""
+    if kind == "sqlite":
+        return SqliteJobStore(path, ttl_seconds=ttl_seconds)
+    if kind == "memory":
+        return MemoryJobStore(ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown JOB_STORE '{kind}'. Use 'memory' or 'sqlite'.")
@@ -0,0 +1,43 @@
+"""
+Offline TTS for TTS_BACKEND=local. A local engine (espeak-ng by default, or e.g. piper) reads
+the text on stdin and writes WAV to stdout; an encoder (lame or ffmpeg) turns that into MP3.
+synthesize() runs inside tts_engine's process pool, so this module imports only the stdlib.
+"""
+import shlex
+import shutil
+import subprocess
+from typing import List, Optional
+
+DEFAULT_COMMAND = "espeak-ng --stdin --stdout -v {lang}"
+# Tried in order when TTS_LOCAL_ENCODER is unset: WAV on stdin -> MP3 on stdout.
+ENCODERS = (
+    "lame --quiet -b 64 - -",
+    "ffmpeg -loglevel error -f wav -i pipe:0 -f mp3 -b:a 64k pipe:1",
+)
+
+def command_args(template: str, lang: str = "en") -> List[str]:
+    """Split a command template; `{lang}` is replaced in each argument."""
+    return [part.replace("{lang}", lang) for part in shlex.split(template)]
+
+def installed(template: str) -> bool:
+    args = shlex.split(template or "")
+    return bool(args) and shutil.which(args[0]) is not None
+
+def find_encoder(configured: Optional[str] = None) -> Optional[str]:
+    """The configured encoder, else the first of ENCODERS that is installed; None if there is none."""
+    for template in ([configured] if configured else ENCODERS):
+        if installed(template):
+            return template
+    return None
+
+def synthesize(text: str, lang: str, command: str, encoder: str, timeout: float = 60.0) -> bytes:
+    """MP3 bytes for text: engine -> WAV -> encoder."""
+    wav = _run(command_args(command, lang), text.encode("utf-8"), timeout)
+    return _run(command_args(encoder, lang), wav, timeout)
+
+def _run(args: List[str], data: bytes, timeout: float) -> bytes:
+    proc = subprocess.run(args, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    if proc.returncode != 0 or not proc.stdout:
+        detail = proc.stderr.decode("utf-8", "replace").strip()[:200]
+        raise RuntimeError(f"{args[0]} exited with {proc.returncode}: {detail or 'no output'}")
+    return proc.stdout
@@ -0,0 +1,184 @@
+"""
+Dependency-free instrumentation: Prometheus-style counters and histograms, plus per-request
+stage timings for the Server-Timing header. Metrics are per worker process.
+
+    with stage("judge"):
+        ...
+    observe_tokens("judge", resp.usage)
+"""
+import re
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+TOKEN_BUCKETS = (50, 100, 200, 400, 800, 1200, 1600, 2400, 3200)
+BYTES_BUCKETS = (16_000, 64_000, 128_000, 256_000, 512_000, 1_000_000, 2_000_000, 4_000_000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_format_labels(k)} {v:g}" for k, v in sorted(self._values.items())]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = SECONDS_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]:g}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+# --- The app's metrics ---
+stage_seconds = Histogram("bedtime_stage_seconds", "Wall time of one pipeline stage (LLM call, TTS request, ...).")
+llm_tokens = Histogram("bedtime_llm_tokens", "Tokens per OpenAI call, from resp.usage.", TOKEN_BUCKETS)
+audio_bytes = Histogram("bedtime_tts_audio_bytes", "MP3 bytes produced per TTS synthesis, by backend.", BYTES_BUCKETS)
+tts_chunks = Counter("bedtime_tts_chunks_total", "TTS chunks served, by source (cache or synth).")
+http_seconds = Histogram("bedtime_http_request_seconds", "Handler wall time until the response starts.")
+http_requests = Counter("bedtime_http_requests_total", "HTTP requests by route and status.")
+errors = Counter("bedtime_stage_errors_total", "Pipeline stages that raised.")
+upstream_events = Counter("bedtime_upstream_events_total", "Upstream retries, hedges, hedge wins and breaker rejections.")
+tts_chars = Counter("bedtime_tts_chars_total", "Characters sent to the TTS backend.")
+encoded_bytes = Histogram("bedtime_audio_encoded_bytes", "Bytes per served clip after post-processing, by audio profile.", BYTES_BUCKETS)
+llm_tokens_estimated = Counter("bedtime_llm_tokens_estimated_total", "Tokens charged by estimate for streams that ended without usage.")
+
+REGISTRY = [stage_seconds, llm_tokens, audio_bytes, tts_chunks, http_seconds, http_requests, errors, upstream_events, tts_chars,
+            encoded_bytes, llm_tokens_estimated]
+
+# --- Per-request stage timings (Server-Timing) ---
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("stage_timings", default=None)
+
+def begin_request() -> List[Tuple[str, float]]:
+    """Start collecting stage timings for the current request (thread or asyncio task)."""
+    timings: List[Tuple[str, float]] = []
+    _timings.set(timings)
+    return timings
+
+@contextmanager
+def stage(name: str):
+    """Time a block into bedtime_stage_seconds and the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+# --- Per-client usage: the caller's sink (set per request, inherited by copied contexts) is charged ---
+_usage_sink: ContextVar[Optional[Callable[[str, float], None]]] = ContextVar("usage_sink", default=None)
+
+def bind_usage(sink: Optional[Callable[[str, float], None]]) -> None:
+    """Charge model tokens and TTS characters spent in this context to sink(resource, amount)."""
+    _usage_sink.set(sink)
+
+def _charge(resource: str, amount: float) -> None:
+    sink = _usage_sink.get()
+    if sink is not None and amount:
+        sink(resource, amount)
+
+def observe_tokens(stage_name: str, usage) -> None:
+    """Record prompt/completion tokens from an OpenAI `usage` object (ignored when absent)."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    llm_tokens.observe(prompt, stage=stage_name, kind="prompt")
+    llm_tokens.observe(completion, stage=stage_name, kind="completion")
+    _charge("tokens", prompt + completion)
+
+def observe_estimated_tokens(stage_name: str, prompt: int, completion: int) -> None:
+    """Charge a stream whose usage chunk never came (stopped early, deadline, disconnect) by estimate."""
+    llm_tokens_estimated.inc(prompt, stage=stage_name, kind="prompt")
+    llm_tokens_estimated.inc(completion, stage=stage_name, kind="completion")
+    _charge("tokens", prompt + completion)
+
+def observe_tts_chars(count: int) -> None:
+    """Characters sent to the TTS backend (cache hits don't count)."""
+    tts_chars.inc(count)
+    _charge("ttsChars", count)
+
+def server_timing(timings: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """Server-Timing header value; repeated stages (e.g. TTS chunks) are summed with a count."""
+    merged: Dict[str, List[float]] = {}
+    for name, elapsed in timings:
+        entry = merged.setdefault(name, [0.0, 0])
+        entry[0] += elapsed
+        entry[1] += 1
+    parts = []
+    for name, (elapsed, count) in merged.items():
+        token = re.sub(r"[^A-Za-z0-9_-]", "-", name)
+        desc = f';desc="{count}x"' if count > 1 else ""
+        parts.append(f"{token};dur={elapsed * 1000:.1f}{desc}")
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+def render(extra: Iterable[str] = ()) -> str:
+    """Prometheus text exposition of every metric, followed by `extra` pre-rendered lines."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += list(extra)
+    return "\n".join(lines) + "\n"
+
+def gauge_lines(name: str, help_text: str, values: Dict[str, float], label: str = "kind") -> List[str]:
+    """Render point-in-time values (cache stats, pool sizes) as a labelled gauge."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f'{name}{{{label}="{k}"}} {v:g}' for k, v in values.items()
+              if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    return lines
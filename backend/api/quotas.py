@@ -0,0 +1,120 @@
+"""
+Per-client usage accounting and token-bucket quotas. Two resources are metered: "tokens"
+(prompt + completion tokens from resp.usage) and "ttsChars" (characters actually sent to
+the TTS backend; cache hits are free). Buckets refill continuously and may go negative,
+since a call's cost is only known once it has finished: a client in debt is refused until
+its bucket climbs back above zero.
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+RESOURCES = ("tokens", "ttsChars")
+
+class QuotaExceeded(Exception):
+    """Raised when a client's bucket is empty; `retry_after` is a whole-second hint."""
+
+    def __init__(self, resource: str, retry_after: int):
+        label = "story" if resource == "tokens" else "narration"
+        super().__init__(f"You have used your {label} allowance for now. Please try again in {retry_after} seconds.")
+        self.resource = resource
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """`capacity` units, refilled at `per_hour` units an hour; not thread-safe (ClientQuotas locks)."""
+
+    def __init__(self, capacity: float, per_hour: float):
+        self.capacity = capacity
+        self.rate = per_hour / 3600.0
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> float:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.level
+
+    def seconds_until_positive(self) -> float:
+        if self.level > 0:
+            return 0.0
+        return (1 - self.level) / self.rate if self.rate > 0 else float("inf")
+
+class ClientUsage:
+    def __init__(self):
+        self.requests = 0
+        self.rejected = 0
+        self.totals: Dict[str, float] = {resource: 0 for resource in RESOURCES}
+        self.buckets: Dict[str, TokenBucket] = {}
+
+class ClientQuotas:
+    """
+    Usage counters for every client, plus buckets for each resource with a non-zero hourly
+    limit (0 = count only). At most `max_clients` are tracked; the least recently seen go first.
+    """
+
+    def __init__(self, limits: Dict[str, float], bursts: Optional[Dict[str, float]] = None, max_clients: int = 10000):
+        self.limits = {r: limits.get(r, 0) for r in RESOURCES}
+        self.bursts = {r: (bursts or {}).get(r) or self.limits[r] / 4 for r in RESOURCES}  # default: 15 minutes' worth
+        self.max_clients = max_clients
+        self.rejected = 0
+        self._clients: "OrderedDict[str, ClientUsage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _client(self, client: str) -> ClientUsage:
+        """Lookup-or-create with refilled buckets; call with the lock held."""
+        usage = self._clients.get(client)
+        if usage is None:
+            usage = self._clients[client] = ClientUsage()
+            for resource, per_hour in self.limits.items():
+                if per_hour > 0:
+                    usage.buckets[resource] = TokenBucket(self.bursts[resource], per_hour)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        self._clients.move_to_end(client)
+        now = time.monotonic()
+        for bucket in usage.buckets.values():
+            bucket.refill(now)
+        return usage
+
+    def admit(self, client: str, resource: str = "tokens") -> None:
+        """Count a request, or raise QuotaExceeded while the client's `resource` bucket is empty."""
+        with self._lock:
+            usage = self._client(client)
+            bucket = usage.buckets.get(resource)
+            if bucket is not None and bucket.level <= 0:
+                usage.rejected += 1
+                self.rejected += 1
+                raise QuotaExceeded(resource, max(1, int(bucket.seconds_until_positive()) + 1))
+            usage.requests += 1
+
+    def allows(self, client: str, resource: str) -> bool:
+        """Whether `resource` may be spent now, without counting a request (e.g. TTS degrades to text-only)."""
+        with self._lock:
+            bucket = self._client(client).buckets.get(resource)
+            return bucket is None or bucket.level > 0
+
+    def charge(self, client: str, resource: str, amount: float) -> None:
+        with self._lock:
+            usage = self._client(client)
+            usage.totals[resource] = usage.totals.get(resource, 0) + amount
+            bucket = usage.buckets.get(resource)
+            if bucket is not None:
+                bucket.level -= amount
+
+    def usage(self, client: str) -> dict:
+        """One client's totals and remaining allowance, as served by GET /api/usage."""
+        with self._lock:
+            usage = self._client(client)
+            limits = {
+                resource: {"perHour": self.limits[resource], "burst": self.bursts[resource],
+                           "remaining": int(bucket.level), "retryAfter": int(bucket.seconds_until_positive() + 0.999)}
+                for resource, bucket in usage.buckets.items()
+            }
+            return {"requests": usage.requests, "rejected": usage.rejected,
+                    "used": {r: int(v) for r, v in usage.totals.items()}, "limits": limits}
+
+    def stats(self) -> dict:
+        with self._lock:
+            totals = {f"{r}Used": int(sum(u.totals.get(r, 0) for u in self._clients.values())) for r in RESOURCES}
+            return {"clients": len(self._clients), "rejected": self.rejected, **totals}
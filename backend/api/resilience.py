@@ -0,0 +1,289 @@
+"""
+Guards for upstream calls (OpenAI, gTTS): a deadline per call, retries with full-jitter
+exponential backoff, optional hedging (a second identical request once the first has taken
+longer than the recent p95), and a circuit breaker that fails fast while upstream is unhealthy.
+
+    story = llm_policy.call(lambda timeout: request(..., timeout=timeout))
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+
+# --- Breaker defaults: BREAKER_FAILURES consecutive upstream failures open it for BREAKER_RESET_SECONDS ---
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+class CircuitOpen(Exception):
+    """Raised without calling upstream while its breaker is open; `retry_after` is a whole-second hint."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"The {name} service is unavailable right now. Please try again shortly.")
+        self.retry_after = retry_after
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, connection errors, 408/409/429 and 5xx are worth another try; anything else isn't."""
+    response = getattr(error, "response", None) or getattr(error, "rsp", None)  # openai / gTTS
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "gTTSError", "ConnectionError", "Timeout",
+                                    "TimeoutExpired", "BrokenProcessPool")
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive upstream failures; open -> half-open
+    after `reset_seconds`, letting one probe through; the probe's outcome closes or re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpen unless a call may go upstream now."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.reset_seconds:
+                self.state = "half-open"
+            if self.state == "closed":
+                return
+            # half-open: one probe at a time (a probe that never reported back expires)
+            if self.state == "half-open" and (self._probe_started is None or now - self._probe_started >= self.reset_seconds):
+                self._probe_started = now
+                return
+        metrics.upstream_events.inc(upstream=self.name, event="rejected")
+        raise CircuitOpen(self.name, self.retry_after())
+
+    def available(self) -> bool:
+        """Whether a call could go through (no state change); used to degrade before trying."""
+        with self._lock:
+            return self.state != "open" or time.monotonic() - self.opened_at >= self.reset_seconds
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state, self.failures, self._probe_started = "closed", 0, None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state, self.opened_at, self._probe_started = "open", time.monotonic(), None
+
+    def retry_after(self) -> int:
+        return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            open_for = time.monotonic() - self.opened_at if self.state == "open" else 0.0
+            return {"state": self.state, "failures": self.failures, "trips": self.trips,
+                    "openSeconds": round(open_for, 1)}
+
+class LatencyWindow:
+    """Recent successful-call durations, for the hedging threshold."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+class Resilience:
+    """
+    One upstream's call policy. call(fn) runs fn(timeout) (timeout = seconds left before the
+    deadline) under the breaker, retrying retryable errors with jittered backoff; with `hedge`
+    a duplicate request starts once the first outlives the recent p95, and the first success
+    wins (`discard` releases the loser's result, e.g. closes a stream). With `streaming`, the
+    result is a stream whose outcome is only known once it has been read: the breaker hears
+    of it from stream_finished() instead of on return.
+    """
+
+    def __init__(self, name: str, deadline: float = 60.0, retries: int = 2, backoff: float = 0.5,
+                 max_backoff: float = 8.0, hedge: bool = False, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker(name)
+        self.latency = LatencyWindow()
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))  # "full jitter"
+
+    def _record(self, error: BaseException) -> bool:
+        """Feed the breaker; returns whether the error is worth retrying."""
+        if is_retryable(error):
+            self.breaker.record_failure()
+            return True
+        self.breaker.record_success()  # upstream answered; the request itself was bad
+        return False
+
+    def stream_finished(self, error: Optional[BaseException] = None) -> None:
+        """Record how a stream opened with streaming=True ended; a mid-stream timeout or drop is a failure."""
+        if error is None:
+            self.breaker.record_success()
+        else:
+            self._record(error)
+
+    def call(self, fn: Callable[[float], T], discard: Optional[Callable[[T], None]] = None, streaming: bool = False) -> T:
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"{self.name} call exceeded its {self.deadline:g}s deadline")
+                started = time.monotonic()
+                result = self._attempt(fn, remaining, discard)
+            except Exception as e:
+                if not self._record(e) or attempt >= self.retries or isinstance(e, DeadlineExceeded):
+                    raise
+                delay = self._backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                metrics.upstream_events.inc(upstream=self.name, event="retry")
+                attempt += 1
+                time.sleep(delay)
+                continue
+            if not streaming:
+                self.breaker.record_success()
+            self.latency.observe(time.monotonic() - started)
+            return result
+
+    def _attempt(self, fn: Callable[[float], T], remaining: float, discard: Optional[Callable[[T], None]]) -> T:
+        hedge_after = self.latency.p95() if self.hedge else None
+        if hedge_after is None or hedge_after >= remaining:
+            return fn(remaining)
+        # Both requests run on the hedge pool, in copies of this context so stage timings still land.
+        end = time.monotonic() + remaining
+        primary = _hedge_pool.submit(contextvars.copy_context().run, fn, remaining)
+        pending = {primary}
+        done, _ = wait(pending, timeout=hedge_after)
+        if not done:
+            metrics.upstream_events.inc(upstream=self.name, event="hedge")
+            pending.add(_hedge_pool.submit(contextvars.copy_context().run, fn, remaining - hedge_after))
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is not None:
+                if winner is not primary:
+                    metrics.upstream_events.inc(upstream=self.name, event="hedge-won")
+                for loser in (done | pending) - {winner}:
+                    loser.add_done_callback(lambda f: _release(f, discard))
+                return winner.result()
+            error = next(iter(done)).exception()
+        for loser in pending:
+            loser.add_done_callback(lambda f: _release(f, discard))
+        raise error or DeadlineExceeded(f"{self.name} call exceeded its {self.deadline:g}s deadline")
+
+    async def acall(self, fn: Callable[[float], Awaitable[T]], discard: Optional[Callable[[T], Awaitable[None]]] = None,
+                    streaming: bool = False) -> T:
+        """asyncio mirror of call(); fn(timeout) returns an awaitable."""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"{self.name} call exceeded its {self.deadline:g}s deadline")
+                started = time.monotonic()
+                result = await self._aattempt(fn, remaining, discard)
+            except Exception as e:
+                if not self._record(e) or attempt >= self.retries or isinstance(e, DeadlineExceeded):
+                    raise
+                delay = self._backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                metrics.upstream_events.inc(upstream=self.name, event="retry")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            if not streaming:
+                self.breaker.record_success()
+            self.latency.observe(time.monotonic() - started)
+            return result
+
+    async def _aattempt(self, fn, remaining: float, discard) -> T:
+        hedge_after = self.latency.p95() if self.hedge else None
+        try:
+            if hedge_after is None or hedge_after >= remaining:
+                return await asyncio.wait_for(fn(remaining), timeout=remaining)
+            end = time.monotonic() + remaining
+            pending = {asyncio.ensure_future(fn(remaining))}
+            primary = next(iter(pending))
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done:
+                metrics.upstream_events.inc(upstream=self.name, event="hedge")
+                pending.add(asyncio.ensure_future(fn(remaining - hedge_after)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, end - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                winner = next((t for t in done if t.exception() is None), None)
+                if winner is not None:
+                    if winner is not primary:
+                        metrics.upstream_events.inc(upstream=self.name, event="hedge-won")
+                    for loser in pending:
+                        loser.cancel()  # an in-flight request is abandoned with its task
+                    for other in done - {winner}:
+                        if discard and other.exception() is None:
+                            await discard(other.result())
+                    return winner.result()
+                error = next(iter(done)).exception()
+            for loser in pending:
+                loser.cancel()
+            raise error or DeadlineExceeded(f"{self.name} call exceeded its {self.deadline:g}s deadline")
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{self.name} call exceeded its {self.deadline:g}s deadline") from None
+
+def _release(future, discard) -> None:
+    """Done-callback for a hedging loser: hand a late success to `discard`."""
+    if discard and not future.cancelled() and future.exception() is None:
+        try:
+            discard(future.result())
+        except Exception:
+            pass
@@ -0,0 +1,234 @@
+import math
+import time
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full; `retry_after` is a whole-second hint."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Too many stories are being written right now. Please try again shortly.")
+        self.retry_after = retry_after
+
+class _Admission:
+    """
+    Shared bookkeeping: counters, the duration EWMA behind Retry-After, and stats. Queueing is
+    fair across clients: each may hold at most `max_queue_per_client` places in the queue, and
+    a freed slot goes to the waiting client with the fewest running pipelines, then the one
+    whose last start is oldest (round-robin), so one busy client can't starve the rest.
+    """
+
+    def __init__(self, max_active: int, max_queue: int, queue_timeout: float, max_queue_per_client: int = 0):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_queue_per_client = max_queue_per_client or max_queue  # 0 = only the global cap
+        self.active = 0
+        self.queued = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.completed = 0
+        self._avg_seconds = 10.0  # EWMA of pipeline duration, seeded with a typical two-pass run
+        self._active_by: Dict[str, int] = {}
+        self._queued_by: Dict[str, int] = {}
+        self._waiting: List[Tuple[int, str]] = []  # (ticket, client) in arrival order
+        self._tickets = itertools.count()
+        self._last_start: Dict[str, int] = {}  # ticket of each busy client's latest start
+
+    def _record(self, seconds: float) -> None:
+        self.completed += 1
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * seconds
+
+    def retry_after(self) -> int:
+        waves = (self.queued + self.active) / max(1, self.max_active)
+        return max(1, math.ceil(self._avg_seconds * waves))
+
+    def full(self) -> bool:
+        return self.active + self.queued >= self.max_active + self.max_queue
+
+    def _admit(self, client: str) -> None:
+        """Reserve a place (running or queued) for client, or raise Overloaded."""
+        if self.full() or self._queued_by.get(client, 0) >= self.max_queue_per_client:
+            self.rejected += 1
+            raise Overloaded(self.retry_after())
+        self.queued += 1
+        self._queued_by[client] = self._queued_by.get(client, 0) + 1
+
+    def _enqueue(self, client: str) -> Tuple[int, str]:
+        waiter = (next(self._tickets), client)
+        self._waiting.append(waiter)
+        return waiter
+
+    def _dequeue(self, waiter: Tuple[int, str]) -> None:
+        self._waiting.remove(waiter)
+        self.queued -= 1
+        _decrement(self._queued_by, waiter[1])
+
+    def _may_start(self, waiter: Tuple[int, str]) -> bool:
+        """A slot is free and `waiter` is next in fair order."""
+        if self.active >= self.max_active:
+            return False
+        fair_order = lambda w: (self._active_by.get(w[1], 0), self._last_start.get(w[1], -1), w[0])
+        return min(self._waiting, key=fair_order) is waiter
+
+    def _started(self, client: str) -> None:
+        self.active += 1
+        self._active_by[client] = self._active_by.get(client, 0) + 1
+        self._last_start[client] = next(self._tickets)
+
+    def _finished(self, client: str, seconds: float) -> None:
+        self.active -= 1
+        _decrement(self._active_by, client)
+        if client not in self._active_by and client not in self._queued_by:
+            self._last_start.pop(client, None)
+        self._record(seconds)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active, "queued": self.queued, "maxActive": self.max_active, "maxQueue": self.max_queue,
+            "coalesced": self.coalesced, "rejected": self.rejected, "completed": self.completed,
+            "avgSeconds": round(self._avg_seconds, 2), "clients": len(self._active_by.keys() | self._queued_by.keys()),
+        }
+
+def _decrement(counts: Dict[str, int], client: str) -> None:
+    counts[client] -= 1
+    if not counts[client]:
+        del counts[client]
+
+class StoryScheduler(_Admission):
+    """
+    Admission control for the thread-per-request Flask app. At most `max_active` story pipelines
+    run at once and `max_queue` more wait (up to `queue_timeout`) for a slot; beyond that callers
+    get Overloaded. Calls sharing a non-None `key` while one is in flight wait for that result
+    instead of starting their own pipeline.
+    """
+
+    def __init__(self, max_active: int = 4, max_queue: int = 16, queue_timeout: float = 30.0, max_queue_per_client: int = 0):
+        super().__init__(max_active, max_queue, queue_timeout, max_queue_per_client)
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def run(self, key: Optional[Hashable], fn: Callable[[], T], client: str = "") -> T:
+        future: Optional[Future] = None
+        with self._lock:
+            leader = self._inflight.get(key) if key is not None else None
+            if leader is not None:
+                self.coalesced += 1
+            else:
+                self._admit(client)
+                if key is not None:
+                    future = self._inflight[key] = Future()
+        if leader is not None:
+            return leader.result()
+
+        try:
+            with self._running(client):
+                result = fn()
+        except BaseException as e:
+            if future is not None:
+                future.set_exception(e)
+            raise
+        finally:
+            if key is not None:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        if future is not None:
+            future.set_result(result)
+        return result
+
+    @contextmanager
+    def slot(self, client: str = ""):
+        """Admission control without coalescing, for work that can't be shared (e.g. an SSE stream)."""
+        with self._lock:
+            self._admit(client)
+        with self._running(client):
+            yield
+
+    @contextmanager
+    def _running(self, client: str):
+        """Wait for a free slot and our fair turn as an already-admitted (queued) caller, then hold it."""
+        deadline = time.monotonic() + self.queue_timeout
+        with self._changed:
+            waiter = self._enqueue(client)
+            try:
+                while not self._may_start(waiter):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise Overloaded(self.retry_after())
+                    self._changed.wait(remaining)
+            finally:
+                self._dequeue(waiter)
+                self._changed.notify_all()  # the head of the fair order may have changed
+            self._started(client)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._finished(client, time.monotonic() - started)
+                self._changed.notify_all()
+
+class AsyncStoryScheduler(_Admission):
+    """asyncio mirror of StoryScheduler for the ASGI entry point."""
+
+    def __init__(self, max_active: int = 16, max_queue: int = 64, queue_timeout: float = 30.0, max_queue_per_client: int = 0):
+        super().__init__(max_active, max_queue, queue_timeout, max_queue_per_client)
+        self._changed: Optional[asyncio.Condition] = None  # created on first use, inside the running loop
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Optional[Hashable], fn: Callable[[], Awaitable[T]], client: str = "") -> T:
+        leader = self._inflight.get(key) if key is not None else None
+        if leader is not None:
+            self.coalesced += 1
+            return await asyncio.shield(leader)
+        self._admit(client)
+
+        future: Optional[asyncio.Future] = None
+        if key is not None:
+            future = self._inflight[key] = asyncio.get_running_loop().create_future()
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())  # no "never retrieved" warnings
+        try:
+            result = await self._run_admitted(fn, client)
+        except BaseException as e:
+            if future is not None:
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            raise
+        finally:
+            if key is not None:
+                self._inflight.pop(key, None)
+        if future is not None:
+            future.set_result(result)
+        return result
+
+    async def _run_admitted(self, fn: Callable[[], Awaitable[T]], client: str) -> T:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        async with self._changed:
+            waiter = self._enqueue(client)
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self._may_start(waiter)), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded(self.retry_after())
+            finally:
+                self._dequeue(waiter)
+                self._changed.notify_all()
+            self._started(client)
+        started = time.monotonic()
+        try:
+            return await fn()
+        finally:
+            self._finished(client, time.monotonic() - started)
+            async with self._changed:
+                self._changed.notify_all()
@@ -0,0 +1,84 @@
+"""
+Local draft scoring for best-of-n generation: a few milliseconds of text statistics instead of
+a judge model call. Each component is 0..1 (1 = on target); banned terms subtract.
+"""
+import re
+from typing import Dict, List, Tuple
+
+BANNED_WORDS = [
+    "kill", "killed", "blood", "bloody", "gun", "guns", "knife", "weapon", "dead", "death", "die", "died",
+    "murder", "stupid", "idiot", "hate", "shut up", "gore", "drunk", "beer", "sexy",
+]
+BANNED_RE = re.compile(r"\b(" + "|".join(re.escape(w) for w in BANNED_WORDS) + r")\b", re.IGNORECASE)
+
+# Flesch-Kincaid grade band per age bracket (the prompts ask for roughly Grade 2–4 overall).
+READING_GRADES = {"young": (1.0, 3.0), "middle": (2.0, 4.0), "older": (3.0, 5.5)}
+DIALOGUE_TARGET = (0.10, 0.40)  # share of characters inside quotes
+WEIGHTS = {"length": 0.30, "readability": 0.25, "dialogue": 0.20, "repetition": 0.25}
+BANNED_PENALTY = 0.5  # per hit
+
+_WORD = re.compile(r"[A-Za-z']+")
+_SENTENCE = re.compile(r"[.!?]+[\"'”’)]*(?:\s|$)")
+_QUOTED = re.compile(r"[\"“]([^\"“”]+)[\"”]")
+_VOWEL_GROUP = re.compile(r"[aeiouy]+")
+
+def syllables(word: str) -> int:
+    word = word.lower().strip("'")
+    count = len(_VOWEL_GROUP.findall(word))
+    if word.endswith("e") and not word.endswith(("le", "ee")) and count > 1:
+        count -= 1  # silent e
+    return max(1, count)
+
+def reading_grade(text: str) -> float:
+    """Flesch-Kincaid grade level with a vowel-group syllable estimate."""
+    words = _WORD.findall(text)
+    if not words:
+        return 0.0
+    sentences = max(1, len(_SENTENCE.findall(text)))
+    syllable_count = sum(syllables(w) for w in words)
+    return 0.39 * len(words) / sentences + 11.8 * syllable_count / len(words) - 15.59
+
+def dialogue_ratio(text: str) -> float:
+    quoted = sum(len(m) for m in _QUOTED.findall(text))
+    return quoted / max(1, len(text))
+
+def repetition_rate(text: str) -> float:
+    """Share of word trigrams that already appeared earlier in the text."""
+    words = [w.lower() for w in _WORD.findall(text)]
+    trigrams = list(zip(words, words[1:], words[2:]))
+    if not trigrams:
+        return 0.0
+    return 1.0 - len(set(trigrams)) / len(trigrams)
+
+def _band(value: float, low: float, high: float, slack: float) -> float:
+    """1 inside [low, high], falling linearly to 0 at `slack` beyond either edge."""
+    if value < low:
+        return max(0.0, 1.0 - (low - value) / slack)
+    if value > high:
+        return max(0.0, 1.0 - (value - high) / slack)
+    return 1.0
+
+def score_story(story: str, word_target: Tuple[int, int], age_bracket: str = "middle") -> Dict[str, float]:
+    """Component scores plus the weighted total under "score"."""
+    words = len(story.split())
+    low, high = word_target
+    grade = reading_grade(story)
+    dialogue = dialogue_ratio(story)
+    repetition = repetition_rate(story)
+    banned = len(BANNED_RE.findall(story))
+    parts = {
+        "length": _band(words, low, high, slack=low / 2),
+        "readability": _band(grade, *READING_GRADES.get(age_bracket, READING_GRADES["middle"]), slack=3.0),
+        "dialogue": _band(dialogue, *DIALOGUE_TARGET, slack=0.2),
+        "repetition": max(0.0, 1.0 - repetition * 5),
+    }
+    total = sum(WEIGHTS[k] * v for k, v in parts.items()) - BANNED_PENALTY * banned
+    return {
+        "score": round(total, 3), "words": words, "grade": round(grade, 1), "dialogue": round(dialogue, 3),
+        "repetition": round(repetition, 3), "banned": banned,
+    }
+
+def rank_drafts(drafts: List[str], word_target: Tuple[int, int], age_bracket: str = "middle") -> List[Tuple[int, Dict[str, float]]]:
+    """(draft index, scores) pairs, best first; ties keep the model's order."""
+    scored = [(i, score_story(d, word_target, age_bracket)) for i, d in enumerate(drafts)]
+    return sorted(scored, key=lambda item: -item[1]["score"])
@@ -0,0 +1,100 @@
+import re
+import time
+import random
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import FrozenSet, Optional, Tuple
+
+_STOPWORDS = frozenset("""
+a an the and or of to in on at for with about from into over under is are was were be been
+who whom that which this these those it its i me my we our you your he she they them his her their
+tell write make please story stories bedtime tale little some very really can could would will
+""".split())
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.findall(r"[a-z0-9']+", (text or "").lower()))
+
+def _stem(word: str) -> str:
+    word = word.strip("'")
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def shingles(text: str) -> FrozenSet[str]:
+    """Content-word unigrams plus adjacent bigrams of the normalized prompt."""
+    words = [_stem(w) for w in normalize_prompt(text).split() if w not in _STOPWORDS]
+    return frozenset(words) | frozenset(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+@dataclass
+class CachedStory:
+    prompt: str
+    story: str
+    category: str
+    age_bracket: str
+    shingles: FrozenSet[str]
+    created: float
+    hits: int = 0
+
+class StoryCache:
+    """
+    Near-duplicate cache of finished stories. Lookups are scoped to (category, age bracket) and
+    match by Jaccard similarity over prompt shingles; among all matches at or above `threshold`
+    one is picked at random, so a lower `max_hits` or higher threshold keeps more variety.
+    """
+
+    def __init__(self, threshold: float = 0.7, ttl_seconds: float = 86400.0, max_entries: int = 500, max_hits: int = 0):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_hits = max_hits  # 0 = unlimited reuse
+        self._entries: "OrderedDict[Tuple[str, str, str], CachedStory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, prompt: str, category: str, age_bracket: str) -> Optional[CachedStory]:
+        query = shingles(prompt)
+        now = time.time()
+        with self._lock:
+            matches = []
+            for key, entry in list(self._entries.items()):
+                if now - entry.created > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                if entry.category != category or entry.age_bracket != age_bracket:
+                    continue
+                if jaccard(query, entry.shingles) >= self.threshold:
+                    matches.append((key, entry))
+            if not matches:
+                self.misses += 1
+                return None
+            key, entry = random.choice(matches)
+            entry.hits += 1
+            self.hits += 1
+            if self.max_hits and entry.hits >= self.max_hits:
+                del self._entries[key]
+            else:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, prompt: str, category: str, age_bracket: str, story: str) -> None:
+        key = (normalize_prompt(prompt), category, age_bracket)
+        entry = CachedStory(prompt, story, category, age_bracket, shingles(prompt), time.time())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "threshold": self.threshold}
@@ -1,7 +1,15 @@
 import os
+import re
+import json
+import time
 import random
-from typing import Optional, List, Tuple
-from openai import OpenAI
+import threading
+from functools import lru_cache
+from typing import Dict, Optional, List, Tuple, Iterator
+
+from .metrics import stage, observe_tokens, observe_estimated_tokens
+from .resilience import DeadlineExceeded, Resilience
+from .scoring import BANNED_RE, rank_drafts
 
 # --- Categories (public labels for UI) ---
 CATEGORIES = {
@@ -39,7 +47,29 @@ def _insp_judge() -> str:
     return ("Originality: phrasing must remain unique; draw only on classic children's storytelling patterns (clear arcs, "
             "gentle stakes, warmth) without referencing external sources.")
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# --- OpenAI client ---
+# One client per process, shared by every call so its HTTP keep-alive pool is reused. Created on
+# first use: importing `openai` is most of this module's import time, which serverless cold starts pay.
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+                client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)  # llm_policy retries
+    return client
+
+# --- Upstream resilience: per-call deadline, jittered retries, optional hedging, circuit breaker ---
+# LLM_HEDGE=1 sends a duplicate request once a call outlives the recent p95 (first answer wins).
+llm_policy = Resilience(
+    "openai",
+    deadline=float(os.getenv("LLM_DEADLINE", "45")),
+    retries=int(os.getenv("LLM_RETRIES", "2")),
+    hedge=os.getenv("LLM_HEDGE", "0") == "1",
+)
 
 # --- Technique library (many-to-many with categories) ---
 TECHNIQUES = {
@@ -77,15 +107,31 @@ CATEGORY_TECHNIQUE_MAP = {
     "Boo!": ["Clear Arc (B-M-E)", "Safe Stakes", "Humor & Surprise", "Sensory Details", "Kid Dialogue", "Positive Moral", "Category Flavor: Boo!"],
 }
 
-def _choose_techniques_for(category: str) -> List[str]:
+def _choose_techniques_for(category: str, rng: random.Random = random) -> List[str]:
     base = CATEGORY_TECHNIQUE_MAP.get(category, ["Clear Arc (B-M-E)", "Show, Don't Tell", "Positive Moral"])
     picks = base[:]
-    random.shuffle(picks)
+    rng.shuffle(picks)
     for g in ["Sensory Details", "Kid Dialogue", "Vocabulary Ceiling"]:
         if g not in picks:
             picks.append(g)
     return picks[:7]
 
+# Rendered technique blocks: TECHNIQUE_VARIANTS seeded orderings per category, built once. The seed
+# makes every worker produce the same variants, so each one is also a reusable upstream cache prefix.
+TECHNIQUE_VARIANTS = int(os.getenv("TECHNIQUE_VARIANTS", "24"))
+
+def _render_techniques(chosen: List[str]) -> str:
+    return "\n".join(f"- {TECHNIQUES[t]}" if t in TECHNIQUES else f"- {t}" for t in chosen)
+
+@lru_cache(maxsize=64)
+def _technique_blocks(category: str) -> Tuple[str, ...]:
+    rng = random.Random(f"techniques:{category}")
+    blocks = {_render_techniques(_choose_techniques_for(category, rng)) for _ in range(TECHNIQUE_VARIANTS)}
+    return tuple(sorted(blocks))
+
+def technique_block(category: str) -> str:
+    return random.choice(_technique_blocks(category))
+
 def detect_category(user_input: str) -> str:
     mapping = {
         "magic_adventure": ["wizard", "magic", "castle", "fairy", "dragon"],
@@ -109,35 +155,203 @@ def determine_age_bracket(age_bracket: str) -> str:
     if ab.startswith("o"): return "older"
     return "middle"
 
-def call_model(messages, temperature=0.7, max_tokens=1600) -> str:
-    resp = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
+def call_model(messages, temperature=0.7, max_tokens=1600, response_format: Optional[dict] = None,
+               stage_name: str = "llm") -> str:
+    """One chat completion; `stage_name` labels its latency and token metrics (draft, judge, ...)."""
+    extra = {"response_format": response_format} if response_format else {}
+    with stage(stage_name):
+        resp = llm_policy.call(lambda timeout: get_client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            **extra,
+        ))
+    observe_tokens(stage_name, getattr(resp, "usage", None))
     return resp.choices[0].message.content.strip()
 
-def build_storyteller_prompt(user_request: str, category: str, age_bracket: str) -> list:
-    chosen = _choose_techniques_for(category)
-    technique_lines = "\n".join([f"- {TECHNIQUES[t]}" if t in TECHNIQUES else f"- {t}" for t in chosen])
+def stream_model(messages, temperature=0.7, max_tokens=1600, stage_name: str = "llm",
+                 stopper: Optional["StoryStopper"] = None) -> Iterator[str]:
+    """
+    Same as call_model, but yields content deltas as they arrive (stream=True). With a `stopper`
+    the stream is closed as soon as it reports the story's closing beat, and it records token use.
+    A stream that ends before its usage chunk (early stop, deadline, disconnect) is charged an
+    estimate: the prompt's size plus one token per streamed delta.
+    """
+    with stage(stage_name):
+        deadline = time.monotonic() + llm_policy.deadline
+        stream = llm_policy.call(lambda timeout: get_client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},  # final chunk carries usage, with no choices
+            timeout=timeout,
+        ), discard=lambda s: s.close(), streaming=True)
+        usage, deltas, error = None, 0, None
+        try:
+            for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise DeadlineExceeded(f"openai stream exceeded its {llm_policy.deadline:g}s deadline")
+                if not chunk.choices:
+                    usage = getattr(chunk, "usage", None)
+                    observe_tokens(stage_name, usage)
+                    if stopper and usage is not None:
+                        stopper.usage = usage
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta.content
+                if delta:
+                    deltas += 1
+                if stopper:
+                    if choice.finish_reason:
+                        stopper.finish_reason = choice.finish_reason
+                    if delta:
+                        delta, done = stopper.feed(delta)
+                        if delta:
+                            yield delta
+                        if done:
+                            return
+                elif delta:
+                    yield delta
+            if stopper:
+                tail = stopper.flush()
+                if tail:
+                    yield tail
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            stream.close()  # stops upstream generation when we return early
+            llm_policy.stream_finished(error)  # a mid-stream drop or DeadlineExceeded counts against the breaker
+            if usage is None:
+                observe_estimated_tokens(stage_name, estimate_prompt_tokens(messages), deltas)
 
-    guidelines = f"""
-You are a veteran children's storyteller writing for ages 5–10 (age bracket: {age_bracket}).
-{_insp_storyteller()}
+def estimate_prompt_tokens(messages) -> int:
+    """Rough prompt size in tokens (TOKENS_PER_WORD per word, plus a few per message)."""
+    return sum(int(len(str(m.get("content") or "").split()) * TOKENS_PER_WORD) + 4 for m in messages)
 
-### Creative brief
-- Category/Style: {category}
-- Reader: a child in the {age_bracket} bracket (keep language accessible; roughly Grade 2–4 reading ease).
-- Length target: 600–900 words (never under 500 words). Prefer elaboration over brevity.
+# --- Length-aware generation ---
+# Word targets per age bracket drive the prompt's length line, check_draft() and the token budget.
+LENGTH_TARGETS = {"young": (400, 650), "middle": (600, 900), "older": (700, 1000)}
+TOKENS_PER_WORD = 1.4  # English prose averages ~1.3 tokens per word; a little headroom on top
+
+def length_target(age_bracket: str) -> Tuple[int, int]:
+    return LENGTH_TARGETS[determine_age_bracket(age_bracket)]
+
+def token_budget(age_bracket: str) -> int:
+    """max_tokens for one story: the bracket's upper word bound plus the slack check_draft allows."""
+    _, high = length_target(age_bracket)
+    return int((high + 50) * TOKENS_PER_WORD) + 64
+
+# The prompts ask for this marker as the story's last line; "fell asleep" or "goodnight" can come mid-plot.
+END_MARKER = "The End."
+_END_LINE = re.compile(r"^\W*the end\W*$", re.IGNORECASE)
+
+def _may_become_marker(line: str) -> bool:
+    """True while an unfinished line could still turn out to be the END_MARKER ("", "**", "The E", ...)."""
+    return "the end".startswith(re.sub(r"^\W+", "", line).lower()) or bool(_END_LINE.match(line.strip()))
+
+class StoryStopper:
+    """
+    Watches a streamed story line by line. A line that is just the END_MARKER the prompts ask
+    for is the closing beat: once the bracket's minimum word count is written, output stops as
+    soon as the marker is complete, so trailing notes and morals-after-the-end aren't generated.
+    The marker itself is never passed on or kept in the text (it isn't narrated); a line that
+    may still become it is held back until it can't. Counts streamed tokens for reporting when
+    upstream usage doesn't arrive.
+    """
+
+    def __init__(self, age_bracket: str, max_tokens: int):
+        self.min_words, _ = length_target(age_bracket)
+        self.max_tokens = max_tokens
+        self.text = ""
+        self.chunks = 0
+        self.stopped_early = False
+        self.finish_reason: Optional[str] = None
+        self.usage = None
+        self._line_start = 0
+        self._passed = 0
+
+    def feed(self, delta: str) -> Tuple[str, bool]:
+        """Returns (text to pass on, done)."""
+        self.chunks += 1
+        self.text += delta
+        while True:
+            brk = self.text.find("\n", self._line_start)
+            line = self.text[self._line_start:brk] if brk >= 0 else self.text[self._line_start:]
+            # A marker is complete at its line break or, without waiting for one, at its closing punctuation.
+            if _END_LINE.match(line.strip()) and (brk >= 0 or not line.strip()[-1].isalnum()):
+                rest = self.text[brk + 1:] if brk >= 0 else ""
+                self.text = self.text[:self._line_start]
+                if len(self.text.split()) >= self.min_words:
+                    self.stopped_early = True
+                    return self._pass_on(len(self.text)), True
+                self.text += rest  # too early to be the ending: drop the marker and keep going
+                continue
+            if brk < 0:
+                break
+            self._line_start = brk + 1
+        return self._pass_on(self._line_start if _may_become_marker(line) else len(self.text)), False
+
+    def flush(self) -> str:
+        """At the end of the stream: the held-back tail (minus a bare marker) still to pass on."""
+        if _END_LINE.match(self.text[self._line_start:].strip()):
+            self.text = self.text[:self._line_start]
+        return self._pass_on(len(self.text))
+
+    def _pass_on(self, upto: int) -> str:
+        out = self.text[self._passed:upto]
+        self._passed = max(self._passed, upto)
+        return out
+
+    def result(self) -> str:
+        self.flush()
+        text = self.text.strip()
+        if self.finish_reason == "length" and not self.stopped_early:
+            text = trim_to_sentence(text)  # out of budget: never end mid-sentence
+        return text
+
+    def report(self) -> dict:
+        usage = self.usage
+        tokens = getattr(usage, "completion_tokens", None) if usage is not None else None
+        return {
+            "maxTokens": self.max_tokens,
+            "completionTokens": tokens if tokens is not None else self.chunks,
+            "stop": "closing-beat" if self.stopped_early else (self.finish_reason or "stop"),
+        }
+
+def trim_to_sentence(text: str) -> str:
+    """Drop a trailing unfinished sentence (keeps the text if no sentence end is found)."""
+    ends = [m.end() for m in re.finditer(r"[.!?][\"'”’)]*(?=\s|$)", text)]
+    return text[:ends[-1]].strip() if ends else text
+
+def call_story_model(messages, age_bracket: str, temperature: float = 0.7, stage_name: str = "llm") -> Tuple[str, dict]:
+    """
+    Generate a story with a bracket-sized token budget, streaming so generation can stop at the
+    closing beat. Returns (story, tokens report).
+    """
+    budget = token_budget(age_bracket)
+    stopper = StoryStopper(age_bracket, budget)
+    for _ in stream_model(messages, temperature=temperature, max_tokens=budget, stage_name=stage_name, stopper=stopper):
+        pass
+    return stopper.result(), stopper.report()
+
+# --- Prompts ---
+# Every request's messages start with a large static system message that is byte-identical across
+# calls (upstream prompt-prefix caching keys on it); the per-request brief and the story follow.
+DEFAULT_STORY_REQUEST = "Tell me a fun and imaginative story for a child."
+
+_STORYTELLER_PREFIX = f"""
+You are a veteran children's storyteller writing for ages 5–10.
+{_insp_storyteller()}
 
 ### Safety & tone
 - Absolutely no gore, sexual content, bullying, or mature themes.
 - Conflict is gentle and safe; end with warmth, reassurance, and hope.
 
-### Story craft to apply
-{technique_lines}
-
 ### Structural beats (keep them clear but graceful)
 1) Beginning — cozy setup: who (kid-friendly names), where (grounding details), what they care about.
 2) Middle — a small challenge or mystery; 2–3 light beats or tries; playful tension; show emotions via action and dialogue.
@@ -154,24 +368,13 @@ You are a veteran children's storyteller writing for ages 5–10 (age bracket: {
 - Do NOT include an outline or section headers—write a single continuous story.
 - Do NOT reference external sources directly.
 - Do NOT break character as a storyteller.
-
-Now write the story that responds to the child's request below while honoring all guidance.
+- Close with a short, cozy final paragraph, then a last line that reads exactly "{END_MARKER}", and stop there.
+- Follow the creative brief that comes next.
 """.strip()
 
-    return [
-        {"role": "system", "content": guidelines},
-        {"role": "user", "content": (user_request or "Tell me a fun and imaginative story for a child.")},
-    ]
-
-def build_judge_prompt(story: str, user_feedback: Optional[str] = None) -> list:
-    originality_line = _insp_judge()
-    revision_brief = f"""
-You are a careful children's story editor (ages 5–10). Revise the story to improve craft and safety.
-Maintain originality; you may rewrite, expand, or trim lines to meet goals.
-
-### Editing checklist (apply all as needed)
+_EDITING_CHECKLIST = f"""
 - Structure & pacing: clear beginning–middle–end; smooth transitions; 2–3 light middle beats.
-- Length: aim 600–900 words. If <500, expand with action, dialogue, and sensory detail (not filler). If >950, tighten gently.
+- Length: hit the word range given for this reader. If short, expand with action, dialogue, and sensory detail (not filler). If long, tighten gently.
 - Age-appropriate language: roughly Grade 2–4; explain rare words in-context.
 - Dialogue: short, lively exchanges; clear speakers.
 - Sensory details: light, concrete anchors (sound, color, texture, smell).
@@ -180,27 +383,293 @@ Maintain originality; you may rewrite, expand, or trim lines to meet goals.
 - Consistency: names/POV stable; remove contradictions.
 - Repetition & clichés: replace with fresh lines.
 - Safety: nothing too scary/mature; reassuring ending.
-- {originality_line}
+- {_insp_judge()}
+""".strip()
+
+_SINGLE_PASS_PREFIX = (
+    _STORYTELLER_PREFIX
+    + "\n\n### Self-edit before answering (apply silently; output only the final story)\n"
+    + _EDITING_CHECKLIST
+)
+
+_JUDGE_BRIEF = f"""
+You are a careful children's story editor (ages 5–10). Revise the story to improve craft and safety.
+Maintain originality; you may rewrite, expand, or trim lines to meet goals.
+
+### Editing checklist (apply all as needed)
+{_EDITING_CHECKLIST}
 
 ### Output rules
 - Return the **revised full story** only (no commentary).
 - Preserve the child-friendly tone; never break the fourth wall.
+- Close with a short, cozy final paragraph, then a last line that reads exactly "{END_MARKER}", and stop there.
 """.strip()
-    if user_feedback:
-        revision_brief += f"\n\n### Additional user feedback to apply now\n- {user_feedback.strip()}\n"
 
+@lru_cache(maxsize=256)
+def _creative_brief(category: str, age_bracket: str) -> str:
+    """Per-(category, bracket) brief header; the techniques block is appended per request."""
+    low, high = length_target(age_bracket)
+    return f"""
+### Creative brief
+- Category/Style: {category}
+- Reader: a child in the {age_bracket} bracket (keep language accessible; roughly Grade 2–4 reading ease).
+- Length target: {low}–{high} words (never under {low - 100} words). Prefer elaboration over brevity.
+
+### Story craft to apply
+""".lstrip()
+
+_BRIEF_CLOSER = "\n\nNow write the story that responds to the child's request below while honoring all guidance."
+
+def _story_messages(prefix: str, user_request: str, category: str, age_bracket: str) -> list:
+    return [
+        {"role": "system", "content": prefix},
+        {"role": "system", "content": _creative_brief(category, age_bracket) + technique_block(category) + _BRIEF_CLOSER},
+        {"role": "user", "content": user_request or DEFAULT_STORY_REQUEST},
+    ]
+
+def build_storyteller_prompt(user_request: str, category: str, age_bracket: str) -> list:
+    return _story_messages(_STORYTELLER_PREFIX, user_request, category, age_bracket)
+
+def build_judge_prompt(story: str, user_feedback: Optional[str] = None, age_bracket: str = "middle") -> list:
+    low, high = length_target(age_bracket)
+    content = _JUDGE_BRIEF + f"\n\n### Length for this reader\n- {low}–{high} words."
+    if user_feedback:
+        content += f"\n\n### Additional user feedback to apply now\n- {user_feedback.strip()}\n"
     return [
-        {"role": "system", "content": revision_brief},
+        {"role": "system", "content": content},
         {"role": "user", "content": story},
     ]
 
-def generate_story_api(user_request: str, age_bracket: str, category: Optional[str] = None) -> Tuple[str, str]:
+def build_single_pass_prompt(user_request: str, category: str, age_bracket: str) -> list:
+    """Storyteller brief with the judge's checklist folded in, so one call yields a finished story."""
+    return _story_messages(_SINGLE_PASS_PREFIX, user_request, category, age_bracket)
+
+# Warm the per-category caches at import so the first request doesn't pay for them.
+for _category in CATEGORIES_PUBLIC:
+    _technique_blocks(_category)
+    for _bracket in ("young", "middle", "older"):
+        _creative_brief(_category, _bracket)
+
+# --- Generation strategies ---
+# two-pass: storyteller then judge. single-pass: one merged prompt.
+# judge-if-needed: storyteller, then the judge only when check_draft() finds a problem.
+# best-of-n: BEST_OF_N storyteller drafts from one request (the API's `n`), ranked locally by scoring.py.
+GENERATION_STRATEGIES = ("two-pass", "single-pass", "judge-if-needed", "best-of-n")
+BEST_OF_N = int(os.getenv("BEST_OF_N", "3"))
+
+def check_draft(story: str, age_bracket: str = "middle") -> List[str]:
+    """Cheap local checks for judge-if-needed; returns the names of the checks that failed."""
+    failed = []
+    words = len(story.split())
+    low, high = length_target(age_bracket)
+    if words < low - 100:
+        failed.append("too-short")
+    elif words > high + 50:
+        failed.append("too-long")
+    if BANNED_RE.search(story):
+        failed.append("banned-words")
+    if not re.search(r'["“”]', story):
+        failed.append("no-dialogue")
+    return failed
+
+def call_model_n(messages, n: int, temperature: float = 0.9, max_tokens: int = 1600,
+                 stage_name: str = "drafts") -> Tuple[List[str], dict]:
+    """n completions of one prompt in a single request; returns (texts, tokens report)."""
+    with stage(stage_name):
+        resp = llm_policy.call(lambda timeout: get_client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            n=n,
+            timeout=timeout,
+        ))
+    usage = getattr(resp, "usage", None)
+    observe_tokens(stage_name, usage)
+    texts = [finished_text(choice) for choice in resp.choices]
+    return texts, {"maxTokens": max_tokens, "completionTokens": getattr(usage, "completion_tokens", None), "n": n}
+
+def finished_text(choice) -> str:
+    text = (choice.message.content or "").strip()
+    return trim_to_sentence(text) if getattr(choice, "finish_reason", None) == "length" else text
+
+def pick_best_draft(drafts: List[str], age_bracket: str) -> Tuple[str, dict]:
+    """The top-scoring draft plus {"chosen": index, "scores": [...]} (scores in draft order)."""
+    ranked = rank_drafts(drafts, length_target(age_bracket), age_bracket)
+    best = ranked[0][0]
+    return drafts[best], {"chosen": best, "scores": [scores for _, scores in sorted(ranked, key=lambda r: r[0])]}
+
+def generate_story_strategy(user_request: str, age_bracket: str, category: Optional[str] = None,
+                            strategy: str = "two-pass") -> Tuple[str, str, dict]:
+    """Returns (story, category, info) where info reports the strategy and the path that actually ran."""
+    if strategy not in GENERATION_STRATEGIES:
+        raise ValueError(f"Unknown generation strategy: {strategy}")
     chosen_category = category or detect_category(user_request)
     ab = determine_age_bracket(age_bracket)
-    draft = call_model(build_storyteller_prompt(user_request, chosen_category, ab), temperature=0.85, max_tokens=1600)
-    improved = call_model(build_judge_prompt(draft), temperature=0.6, max_tokens=1600)
-    return improved, chosen_category
+    tokens: Dict[str, dict] = {}
+    if strategy == "single-pass":
+        story, tokens["single-pass"] = call_story_model(build_single_pass_prompt(user_request, chosen_category, ab), ab,
+                                                        temperature=0.8, stage_name="single-pass")
+        return story, chosen_category, {"strategy": strategy, "path": "single-pass", "tokens": tokens}
+
+    if strategy == "best-of-n":
+        drafts, tokens["drafts"] = call_model_n(build_storyteller_prompt(user_request, chosen_category, ab), BEST_OF_N,
+                                                temperature=0.9, max_tokens=token_budget(ab))
+        story, ranking = pick_best_draft(drafts, ab)
+        return story, chosen_category, {"strategy": strategy, "path": "best-of-n", **ranking, "tokens": tokens}
+
+    draft, tokens["draft"] = call_story_model(build_storyteller_prompt(user_request, chosen_category, ab), ab,
+                                              temperature=0.85, stage_name="draft")
+    if strategy == "judge-if-needed":
+        failed = check_draft(draft, ab)
+        if not failed:
+            return draft, chosen_category, {"strategy": strategy, "path": "draft-only", "checks": [], "tokens": tokens}
+        improved, tokens["judge"] = call_story_model(build_judge_prompt(draft, age_bracket=ab), ab,
+                                                     temperature=0.6, stage_name="judge")
+        return improved, chosen_category, {"strategy": strategy, "path": "draft+judge", "checks": failed, "tokens": tokens}
+
+    improved, tokens["judge"] = call_story_model(build_judge_prompt(draft, age_bracket=ab), ab, temperature=0.6, stage_name="judge")
+    return improved, chosen_category, {"strategy": strategy, "path": "two-pass", "tokens": tokens}
+
+def generate_story_api(user_request: str, age_bracket: str, category: Optional[str] = None) -> Tuple[str, str]:
+    story, chosen_category, _ = generate_story_strategy(user_request, age_bracket, category)
+    return story, chosen_category
 
-def revise_story_api(current_story: str, user_feedback: str) -> str:
-    revised = call_model(build_judge_prompt(current_story, user_feedback=user_feedback), temperature=0.6, max_tokens=1600)
+def revise_story_api(current_story: str, user_feedback: str, age_bracket: str = "middle") -> str:
+    """Full judge rewrite with the feedback, held to the story's age bracket and its token budget."""
+    ab = determine_age_bracket(age_bracket)
+    revised, _ = call_story_model(build_judge_prompt(current_story, user_feedback=user_feedback, age_bracket=ab), ab,
+                                  temperature=0.6, stage_name="revise")
     return revised
+
+# --- Incremental (patch) revision ---
+REVISION_MODES = ("patch", "full")
+PATCH_OPS = ("replace", "insert_after", "delete")
+
+def split_paragraphs(story: str) -> List[str]:
+    return [p.strip() for p in re.split(r"\n\s*\n|\n", story or "") if p.strip()]
+
+_PATCH_BRIEF = """
+You are a careful children's story editor (ages 5–10). Apply the parent's feedback with the smallest possible change.
+The story is given as numbered paragraphs like "[3] ...".
+
+### Rules
+- Edit only the paragraphs that must change to honor the feedback; never return untouched paragraphs.
+- Keep names, tone, tense, and continuity consistent with the paragraphs you leave alone.
+- Keep it kid-safe, warm, and roughly Grade 2–4 readability.
+
+### Output
+Return only a JSON object, no commentary:
+{"edits": [{"op": "replace", "paragraph": 3, "text": "..."},
+           {"op": "insert_after", "paragraph": 5, "text": "..."},
+           {"op": "delete", "paragraph": 7}]}
+Use "insert_after" with paragraph 0 to add a new opening paragraph.
+""".strip()
+
+def build_patch_prompt(paragraphs: List[str], user_feedback: str) -> list:
+    # Story before feedback: repeated edits of the same version share the longer prefix.
+    numbered = "\n\n".join(f"[{i}] {p}" for i, p in enumerate(paragraphs, start=1))
+    return [
+        {"role": "system", "content": _PATCH_BRIEF},
+        {"role": "user", "content": f"Story:\n{numbered}\n\nFeedback: {user_feedback.strip()}"},
+    ]
+
+def parse_patch(raw: str, paragraph_count: int) -> List[dict]:
+    """Parse and validate the model's JSON edits; raises ValueError if anything is off."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw.strip())
+    data = json.loads(text)
+    edits = data.get("edits") if isinstance(data, dict) else data
+    if not isinstance(edits, list):
+        raise ValueError("Patch has no 'edits' list.")
+    for edit in edits:
+        if not isinstance(edit, dict) or edit.get("op") not in PATCH_OPS:
+            raise ValueError(f"Invalid edit: {edit!r}")
+        index = edit.get("paragraph")
+        low = 0 if edit["op"] == "insert_after" else 1
+        if type(index) is not int or not low <= index <= paragraph_count:  # bool is an int subclass
+            raise ValueError(f"Edit targets missing paragraph: {edit!r}")
+        if edit["op"] != "delete" and not (isinstance(edit.get("text"), str) and edit["text"].strip()):
+            raise ValueError(f"Edit has no text: {edit!r}")
+    return edits
+
+def apply_patch(paragraphs: List[str], edits: List[dict]) -> List[str]:
+    """Apply edits addressed by original 1-based paragraph numbers."""
+    replaced = {e["paragraph"]: e["text"].strip() for e in edits if e["op"] == "replace"}
+    deleted = {e["paragraph"] for e in edits if e["op"] == "delete"}
+    inserted: dict = {}
+    for e in edits:
+        if e["op"] == "insert_after":
+            inserted.setdefault(e["paragraph"], []).append(e["text"].strip())
+    result = list(inserted.get(0, []))
+    for i, paragraph in enumerate(paragraphs, start=1):
+        if i not in deleted:
+            result.append(replaced.get(i, paragraph))
+        result.extend(inserted.get(i, []))
+    return result
+
+def revise_story_incremental(current_story: str, user_feedback: str, paragraphs: Optional[List[str]] = None,
+                             age_bracket: str = "middle") -> Tuple[str, dict]:
+    """
+    Targeted revision: the model returns paragraph-scoped edits that are applied server-side, so
+    untouched paragraphs (and their cached audio chunks) stay byte-identical. Falls back to a full
+    judge rewrite when there is no feedback or the patch can't be used. Pass `paragraphs` when
+    the split is already known (e.g. from a stored story session).
+    """
+    paragraphs = paragraphs or split_paragraphs(current_story)
+    if user_feedback.strip() and paragraphs:
+        raw = call_model(build_patch_prompt(paragraphs, user_feedback), temperature=0.4, max_tokens=900,
+                         response_format={"type": "json_object"}, stage_name="patch")
+        try:
+            edits = parse_patch(raw, len(paragraphs))
+        except ValueError:
+            edits = None
+        if edits:
+            revised = apply_patch(paragraphs, edits)
+            changed = sorted({e["paragraph"] for e in edits})
+            return "\n\n".join(revised), {"mode": "patch", "editedParagraphs": changed, "paragraphs": len(revised)}
+    revised = revise_story_api(current_story, user_feedback=user_feedback, age_bracket=age_bracket)
+    return revised, {"mode": "full"}
+
+def generate_story_stream(user_request: str, age_bracket: str, category: Optional[str] = None,
+                          strategy: str = "two-pass") -> Iterator[Tuple[str, dict]]:
+    """
+    Streaming variant of generate_story_strategy. Yields (event, payload) pairs:
+      ("stage", {"stage": "drafting" | "judging", ...}), ("delta", {"text": ...}) for the final story,
+      and a last ("story", {"story": ..., "category": ..., "strategy": ..., "path": ...}).
+    """
+    if strategy not in GENERATION_STRATEGIES:
+        raise ValueError(f"Unknown generation strategy: {strategy}")
+    chosen_category = category or detect_category(user_request)
+    ab = determine_age_bracket(age_bracket)
+    yield "stage", {"stage": "drafting", "category": chosen_category}
+    info = {"strategy": strategy, "path": strategy}
+    if strategy == "single-pass":
+        messages = build_single_pass_prompt(user_request, chosen_category, ab)
+        temperature, final_stage = 0.8, "single-pass"
+    elif strategy == "best-of-n":
+        drafts, draft_tokens = call_model_n(build_storyteller_prompt(user_request, chosen_category, ab), BEST_OF_N,
+                                            temperature=0.9, max_tokens=token_budget(ab))
+        story, ranking = pick_best_draft(drafts, ab)
+        yield "delta", {"text": story}
+        yield "story", {"story": story, "category": chosen_category, **info, **ranking, "tokens": {"drafts": draft_tokens}}
+        return
+    else:
+        draft, draft_tokens = call_story_model(build_storyteller_prompt(user_request, chosen_category, ab), ab,
+                                               temperature=0.85, stage_name="draft")
+        info["tokens"] = {"draft": draft_tokens}
+        if strategy == "judge-if-needed":
+            failed = check_draft(draft, ab)
+            info.update(path="draft+judge" if failed else "draft-only", checks=failed)
+            if not failed:
+                yield "delta", {"text": draft}
+                yield "story", {"story": draft, "category": chosen_category, **info}
+                return
+        yield "stage", {"stage": "judging"}
+        messages = build_judge_prompt(draft, age_bracket=ab)
+        temperature, final_stage = 0.6, "judge"
+    budget = token_budget(ab)
+    stopper = StoryStopper(ab, budget)
+    for delta in stream_model(messages, temperature=temperature, max_tokens=budget, stage_name=final_stage, stopper=stopper):
+        yield "delta", {"text": delta}
+    info["tokens"] = {**info.get("tokens", {}), final_stage: stopper.report()}
+    yield "story", {"story": stopper.result(), "category": chosen_category, **info}
@@ -0,0 +1,114 @@
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Optional, Set, Tuple
+
+log = logging.getLogger("api")
+
+AGE_BRACKETS = ("young", "middle", "older")
+
+@dataclass
+class PooledStory:
+    story: str
+    category: str
+    age_bracket: str
+    audio: Optional[bytes] = None
+    served_to: Set[str] = field(default_factory=set)
+
+    @property
+    def story_id(self) -> str:
+        return hashlib.sha256(self.story.encode("utf-8")).hexdigest()
+
+class StoryPool:
+    """
+    Warm pool of ready-made stories (plus audio) per (category, age bracket) for prompt-less
+    clicks. A daemon thread tops every pool up to `depth`; each story is handed out at most
+    `max_serves` times and never twice to the same client.
+    """
+
+    def __init__(
+        self,
+        categories,
+        generate: Callable[[str, str], str],
+        synthesize: Optional[Callable[[str], Optional[bytes]]] = None,
+        depth: int = 2,
+        max_serves: int = 3,
+        idle_seconds: float = 5.0,
+        max_clients: int = 10000,
+    ):
+        self.generate = generate
+        self.synthesize = synthesize
+        self.depth = depth
+        self.max_serves = max_serves
+        self.idle_seconds = idle_seconds
+        self.max_clients = max_clients
+        self._pools: Dict[Tuple[str, str], Deque[PooledStory]] = {
+            (c, b): deque() for c in categories for b in AGE_BRACKETS
+        }
+        self._seen: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refill_forever, name="story-pool", daemon=True)
+            self._thread.start()
+
+    def take(self, category: str, age_bracket: str, client_id: str) -> Optional[PooledStory]:
+        with self._lock:
+            pool = self._pools.get((category, age_bracket))
+            seen = self._seen.get(client_id, set())
+            entry = next((e for e in pool or () if e.story_id not in seen), None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.served_to.add(client_id)
+            if len(entry.served_to) >= self.max_serves:
+                pool.remove(entry)
+            self._seen.setdefault(client_id, set()).add(entry.story_id)
+            self._seen.move_to_end(client_id)
+            while len(self._seen) > self.max_clients:
+                self._seen.popitem(last=False)
+        self._wake.set()
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            ready = sum(len(p) for p in self._pools.values())
+            return {"depth": self.depth, "ready": ready, "hits": self.hits, "misses": self.misses}
+
+    # --- background refill ---
+    def _next_short_pool(self) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            short = [key for key, pool in self._pools.items() if len(pool) < self.depth]
+        if not short:
+            return None
+        return min(short, key=lambda k: (len(self._pools[k]), random.random()))
+
+    def _refill_forever(self) -> None:
+        backoff = self.idle_seconds
+        while True:
+            key = self._next_short_pool()
+            if key is None:
+                self._wake.wait(self.idle_seconds)
+                self._wake.clear()
+                continue
+            category, age_bracket = key
+            try:
+                story = self.generate(category, age_bracket)
+                audio = self.synthesize(story) if self.synthesize else None
+                with self._lock:
+                    self._pools[key].append(PooledStory(story, category, age_bracket, audio))
+                backoff = self.idle_seconds
+            except Exception:
+                log.exception("Story pool refill failed for %s/%s", category, age_bracket)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 300.0)
@@ -0,0 +1,185 @@
+import json
+import time
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+@dataclass
+class StoryVersion:
+    version: int
+    story: str
+    paragraphs: List[str]
+    audio_id: Optional[str] = None
+    feedback: Optional[str] = None  # the revision request that produced this version
+    info: dict = field(default_factory=dict)
+    created: float = field(default_factory=time.time)
+
+    def to_json(self) -> dict:
+        return {"version": self.version, "story": self.story, "audioId": self.audio_id,
+                "feedback": self.feedback, "revision": self.info or None, "created": self.created}
+
+@dataclass
+class StorySession:
+    story_id: str
+    category: str
+    age_bracket: str
+    versions: List[StoryVersion]
+    updated: float = field(default_factory=time.time)
+
+    @property
+    def latest(self) -> StoryVersion:
+        return self.versions[-1]
+
+    def find_revision(self, parent: int, feedback: str) -> Optional[StoryVersion]:
+        """An existing version produced from `parent` by the same feedback, if any."""
+        for v in self.versions:
+            if v.feedback == feedback and v.info.get("parent") == parent:
+                return v
+        return None
+
+def new_story_id() -> str:
+    return secrets.token_urlsafe(12)
+
+class MemoryStoryStore:
+    """
+    In-process story sessions (one worker): an LRU of up to `max_sessions`, each keeping its last
+    `max_versions` versions. Sessions idle for `ttl_seconds` are dropped.
+    """
+    kind = "memory"
+
+    def __init__(self, max_sessions: int = 1000, max_versions: int = 20, ttl_seconds: float = 86400.0):
+        self.max_sessions = max_sessions
+        self.max_versions = max_versions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, StorySession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, first: StoryVersion, category: str, age_bracket: str) -> str:
+        session = StorySession(new_story_id(), category, age_bracket, [first])
+        with self._lock:
+            self._sessions[session.story_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session.story_id
+
+    def get(self, story_id: str) -> Optional[StorySession]:
+        with self._lock:
+            session = self._sessions.get(story_id)
+            if session is None:
+                return None
+            if time.time() - session.updated > self.ttl_seconds:
+                del self._sessions[story_id]
+                return None
+            self._sessions.move_to_end(story_id)
+            return session
+
+    def append(self, story_id: str, version: StoryVersion) -> Optional[StoryVersion]:
+        """Add `version` as the newest (its number is assigned here); None if the session is gone or expired."""
+        with self._lock:
+            session = self._sessions.get(story_id)
+            if session is None:
+                return None
+            if time.time() - session.updated > self.ttl_seconds:
+                del self._sessions[story_id]
+                return None
+            version.version = session.latest.version + 1
+            session.versions = (session.versions + [version])[-self.max_versions:]
+            session.updated = time.time()
+            self._sessions.move_to_end(story_id)
+            return version
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"kind": self.kind, "sessions": len(self._sessions)}
+
+class SqliteStoryStore:
+    """
+    Story sessions in a SQLite file, shared by every worker on the host. Same interface as
+    MemoryStoryStore; a short-lived connection per call keeps it thread- and fork-safe.
+    """
+    kind = "sqlite"
+
+    def __init__(self, path: str, max_versions: int = 20, ttl_seconds: float = 86400.0):
+        self.path = path
+        self.max_versions = max_versions
+        self.ttl_seconds = ttl_seconds
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                story_id TEXT PRIMARY KEY, category TEXT, age_bracket TEXT, updated REAL)""")
+            db.execute("""CREATE TABLE IF NOT EXISTS versions (
+                story_id TEXT, version INTEGER, story TEXT, paragraphs TEXT, audio_id TEXT,
+                feedback TEXT, info TEXT, created REAL, PRIMARY KEY (story_id, version))""")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10.0)
+        try:
+            with db:  # commit on success, roll back on error
+                yield db
+        finally:
+            db.close()
+
+    def _insert_version(self, db: sqlite3.Connection, story_id: str, v: StoryVersion) -> None:
+        db.execute(
+            "INSERT INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (story_id, v.version, v.story, json.dumps(v.paragraphs), v.audio_id, v.feedback, json.dumps(v.info), v.created),
+        )
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        db.execute("DELETE FROM versions WHERE story_id IN (SELECT story_id FROM sessions WHERE updated < ?)", (cutoff,))
+        db.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,))
+
+    def create(self, first: StoryVersion, category: str, age_bracket: str) -> str:
+        story_id = new_story_id()
+        with self._connect() as db:
+            self._prune(db)
+            db.execute("INSERT INTO sessions VALUES (?, ?, ?, ?)", (story_id, category, age_bracket, time.time()))
+            self._insert_version(db, story_id, first)
+        return story_id
+
+    def get(self, story_id: str) -> Optional[StorySession]:
+        with self._connect() as db:
+            row = db.execute("SELECT category, age_bracket, updated FROM sessions WHERE story_id = ?", (story_id,)).fetchone()
+            if row is None or time.time() - row[2] > self.ttl_seconds:
+                return None
+            rows = db.execute(
+                "SELECT version, story, paragraphs, audio_id, feedback, info, created FROM versions "
+                "WHERE story_id = ? ORDER BY version", (story_id,),
+            ).fetchall()
+        versions = [StoryVersion(r[0], r[1], json.loads(r[2]), r[3], r[4], json.loads(r[5]), r[6]) for r in rows]
+        return StorySession(story_id, row[0], row[1], versions, row[2]) if versions else None
+
+    def append(self, story_id: str, version: StoryVersion) -> Optional[StoryVersion]:
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT updated FROM sessions WHERE story_id = ?", (story_id,)).fetchone()
+            if row is None or time.time() - row[0] > self.ttl_seconds:
+                return None  # expired sessions are left for _prune, as in get()
+            latest = db.execute("SELECT MAX(version) FROM versions WHERE story_id = ?", (story_id,)).fetchone()[0]
+            if latest is None:
+                return None
+            version.version = latest + 1
+            self._insert_version(db, story_id, version)
+            db.execute("DELETE FROM versions WHERE story_id = ? AND version <= ?", (story_id, version.version - self.max_versions))
+            db.execute("UPDATE sessions SET updated = ? WHERE story_id = ?", (time.time(), story_id))
+        return version
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            sessions = db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"kind": self.kind, "sessions": sessions}
+
+def make_story_store(kind: str = "memory", path: str = "stories.db", max_sessions: int = 1000,
+                     max_versions: int = 20, ttl_seconds: float = 86400.0):
+    """STORY_STORE=memory (per worker) or sqlite (shared across workers on one host)."""
+    if kind == "sqlite":
+        return SqliteStoryStore(path, max_versions=max_versions, ttl_seconds=ttl_seconds)
+    if kind == "memory":
+        return MemoryStoryStore(max_sessions=max_sessions, max_versions=max_versions, ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown STORY_STORE '{kind}'. Use 'memory' or 'sqlite'.")
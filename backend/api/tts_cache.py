@@ -0,0 +1,198 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+def audio_key(text: str, lang: str = "en", voice: Optional[str] = None) -> str:
+    """Content address for a synthesized clip: sha256 over (text, lang, voice)."""
+    h = hashlib.sha256()
+    for part in (text, lang, voice or ""):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+class AudioCache:
+    """
+    Two-tier MP3 cache: a bounded in-memory LRU (by total bytes) in front of an optional
+    on-disk directory (shared across gunicorn workers) with oldest-first size eviction.
+    The disk tier also holds `<key>.part` files for clips still being synthesized, so any
+    worker can follow a clip that another one is producing.
+    """
+
+    def __init__(self, max_memory_bytes: int, disk_dir: Optional[str] = None, max_disk_bytes: int = 0):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._disk_bytes = 0  # running estimate: this worker's puts since the last full scan
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    # --- public API ---
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.hits_memory += 1
+                return data
+        data = self._disk_get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits_disk += 1
+            self._mem_put(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._mem_put(key, data)
+        self._disk_put(key, data)
+
+    @property
+    def shared(self) -> bool:
+        """Whether other workers see this cache (the disk tier is on)."""
+        return bool(self.disk_dir)
+
+    # --- in-flight clips (disk tier only) ---
+    def partial_start(self, key: str) -> None:
+        self._partial_write(key, b"", "wb")
+
+    def partial_append(self, key: str, data: bytes) -> None:
+        self._partial_write(key, data, "ab")
+
+    def partial_discard(self, key: str) -> None:
+        if self.disk_dir:
+            try:
+                os.remove(self._partial_path(key))
+            except OSError:
+                pass
+
+    def partial_read(self, key: str, offset: int) -> Optional[Tuple[bytes, float]]:
+        """(bytes from `offset`, mtime) of an in-flight clip, or None once it has finished or failed."""
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._partial_path(key), "rb") as f:
+                f.seek(offset)
+                return f.read(), os.fstat(f.fileno()).st_mtime
+        except OSError:
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hitsMemory": self.hits_memory,
+                "hitsDisk": self.hits_disk,
+                "misses": self.misses,
+                "entries": len(self._mem),
+                "memoryBytes": self._mem_bytes,
+                "disk": bool(self.disk_dir),
+            }
+
+    # --- memory tier (call with lock held) ---
+    def _mem_put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_memory_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old)
+        self._mem[key] = data
+        self._mem_bytes += len(data)
+        while self._mem_bytes > self.max_memory_bytes:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+
+    # --- disk tier ---
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.mp3")
+
+    def _partial_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.part")
+
+    def _partial_write(self, key: str, data: bytes, mode: str) -> None:
+        if not self.disk_dir:
+            return
+        try:
+            with open(self._partial_path(key), mode) as f:
+                f.write(data)
+        except OSError:
+            pass
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # bump recency for eviction
+            return data
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        if not self.disk_dir or len(data) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)  # atomic, safe across workers
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(data) - replaced
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._disk_evict()
+
+    def _disk_entries(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, name) of every cached clip."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".mp3"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def _disk_evict(self) -> None:
+        """
+        Full scan, oldest first, once the running total passes the cap. Evicts down to 90% of
+        the cap so the next scan is a while off. The scan also picks up clips other workers
+        wrote, which this worker's total doesn't see.
+        """
+        try:
+            entries = sorted(self._disk_entries())
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9 if total > self.max_disk_bytes else self.max_disk_bytes
+        for _, size, name in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
@@ -1,34 +1,491 @@
 import os
+import re
+import time
+import queue
 import base64
-from io import BytesIO
-from typing import Optional
+import logging
+import secrets
+import threading
+import contextvars
+import importlib.util
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
+from . import metrics
+from . import local_tts
+from . import audio_profiles
+from .audio_profiles import AudioProfile
+from .metrics import stage
+from .resilience import Resilience
+from .audio_store import AudioClip, AudioStore
+from .tts_cache import AudioCache, audio_key
+
+log = logging.getLogger("api")
+
+# --- Synthesizer backend (TTS_BACKEND=gtts or local) ---
+# gtts: Google Translate TTS over the network (default; most natural voice, slowest stage after the LLM).
+# local: an offline engine (espeak-ng, or piper via TTS_LOCAL_COMMAND) in a process pool; a plainer
+# voice, but no network round trip and latency that depends only on local CPU.
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts").strip().lower()
+TTS_LOCAL_COMMAND = os.getenv("TTS_LOCAL_COMMAND", local_tts.DEFAULT_COMMAND)
+TTS_LOCAL_ENCODER = os.getenv("TTS_LOCAL_ENCODER") or None  # default: lame, else ffmpeg
+TTS_LOCAL_PROCESSES = int(os.getenv("TTS_LOCAL_PROCESSES", str(min(4, os.cpu_count() or 1))))
+TTS_LOCAL_TIMEOUT = float(os.getenv("TTS_LOCAL_TIMEOUT", "60"))
+# gtts transport: one keep-alive pool per worker (see gtts_transport.py). GTTS_BASE_URL points it
+# at a stand-in server (e.g. bench/mock_gtts.py) instead of translate.google.com.
+GTTS_POOL_SIZE = int(os.getenv("GTTS_POOL_SIZE", "8"))
+GTTS_CONNECT_TIMEOUT = float(os.getenv("GTTS_CONNECT_TIMEOUT", "3.05"))
+GTTS_READ_TIMEOUT = float(os.getenv("GTTS_READ_TIMEOUT", "15"))
+GTTS_BASE_URL = os.getenv("GTTS_BASE_URL")
+
+class _SpawnedPool:
+    """
+    A process pool started on first use. Its workers are spawned, not forked: forking a process
+    that is already running request threads isn't safe. A crashed worker breaks the pool, so a
+    broken pool is replaced on the next call.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+            pool = self._pool
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+
+class Synthesizer:
+    """A TTS backend: MP3 bytes for one chunk of text. Chunking, caching and streaming are shared."""
+    name = "none"
+
+    def available(self) -> bool:
+        return False
+
+    def synthesize(self, text: str, lang: str = "en", timeout: Optional[float] = None) -> bytes:
+        raise NotImplementedError
+
+class GTTSSynthesizer(Synthesizer):
+    """gTTS over a shared keep-alive connection pool, created (with `requests`) on first use."""
+    name = "gtts"
+
+    def __init__(self, pool_size: int = 8, connect_timeout: float = 3.05, read_timeout: float = 15.0,
+                 base_url: Optional[str] = None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.base_url = base_url
+        self._transport = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return _gtts_installed()
+
+    def synthesize(self, text: str, lang: str = "en", timeout: Optional[float] = None) -> bytes:
+        return self.transport().synthesize(_make_gtts(text, lang=lang), timeout=timeout)
+
+    def transport(self):
+        with self._lock:
+            if self._transport is None:
+                from .gtts_transport import GTTSTransport
+                self._transport = GTTSTransport(self.pool_size, self.connect_timeout, self.read_timeout, self.base_url)
+            return self._transport
+
+class LocalSynthesizer(Synthesizer):
+    """
+    Offline synthesis with local_tts (engine command + MP3 encoder). Calls run in a small spawned
+    process pool, which caps CPU-bound synthesis per worker and keeps it off the request threads.
+    """
+    name = "local"
+
+    def __init__(self, command: str, encoder: Optional[str] = None, processes: int = 2, timeout: float = 60.0):
+        self.command = command
+        self.encoder = local_tts.find_encoder(encoder)
+        self.timeout = timeout
+        self._available: Optional[bool] = None
+        self._pool = _SpawnedPool(processes)
+
+    def available(self) -> bool:
+        if self._available is None:
+            self._available = local_tts.installed(self.command) and self.encoder is not None
+            if not self._available:
+                log.warning("TTS_BACKEND=local needs '%s' and an MP3 encoder (lame or ffmpeg); audio is off.",
+                            self.command.split()[0])
+        return self._available
+
+    def synthesize(self, text: str, lang: str = "en", timeout: Optional[float] = None) -> bytes:
+        timeout = min(self.timeout, timeout) if timeout else self.timeout
+        return self._pool.run(local_tts.synthesize, text, lang, self.command, self.encoder, timeout)
+
+def make_synthesizer(kind: str) -> Synthesizer:
+    if kind == "gtts":
+        return GTTSSynthesizer(GTTS_POOL_SIZE, GTTS_CONNECT_TIMEOUT, GTTS_READ_TIMEOUT, GTTS_BASE_URL)
+    if kind == "local":
+        return LocalSynthesizer(TTS_LOCAL_COMMAND, TTS_LOCAL_ENCODER, processes=TTS_LOCAL_PROCESSES,
+                                timeout=TTS_LOCAL_TIMEOUT)
+    raise ValueError(f"Unknown TTS_BACKEND '{kind}'. Use 'gtts' or 'local'.")
+
+synthesizer = make_synthesizer(TTS_BACKEND)
+
+# --- Upstream resilience: per-chunk deadline and retries; while the breaker is open, stories go out text-only ---
+tts_policy = Resilience(
+    "tts",
+    deadline=float(os.getenv("TTS_DEADLINE", "20")),
+    retries=int(os.getenv("TTS_RETRIES", "2")),
+    hedge=os.getenv("TTS_HEDGE", "0") == "1",
+)
+
+# --- Audio cache (TTS_CACHE_DIR enables the shared on-disk tier) ---
+# Audio ids don't name the backend, so a non-default backend keeps its clips in a subdirectory.
+_cache_dir = os.getenv("TTS_CACHE_DIR") or None
+_cache = AudioCache(
+    max_memory_bytes=int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024))),
+    disk_dir=os.path.join(_cache_dir, synthesizer.name) if _cache_dir and synthesizer.name != "gtts" else _cache_dir,
+    max_disk_bytes=int(os.getenv("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024))),
+)
+
+# --- Audio post-processing: AUDIO_PROFILE by default, ?format= or Accept per request (see audio_profiles.py) ---
+AUDIO_PROFILE = os.getenv("AUDIO_PROFILE", "speech")
+AUDIO_FFMPEG = os.getenv("AUDIO_FFMPEG", "ffmpeg")
+AUDIO_TRANSCODE_PROCESSES = int(os.getenv("AUDIO_TRANSCODE_PROCESSES", "2"))
+AUDIO_TRANSCODE_TIMEOUT = float(os.getenv("AUDIO_TRANSCODE_TIMEOUT", "60"))
+_transcode_pool = _SpawnedPool(AUDIO_TRANSCODE_PROCESSES)
+
+@lru_cache(maxsize=1)
+def transcoding_available() -> bool:
+    if not audio_profiles.installed(AUDIO_FFMPEG):
+        log.warning("AUDIO_FFMPEG '%s' is not installed; audio is served as synthesized.", AUDIO_FFMPEG)
+        return False
+    return True
+
+def audio_profile(requested: Optional[str] = None, accepted: Optional[str] = None) -> AudioProfile:
+    """
+    Resolve a request's profile (see audio_profiles.choose_profile). Falls back to "original"
+    when ffmpeg isn't installed. ValueError for an unknown ?format=.
+    """
+    profile = audio_profiles.choose_profile(requested, accepted, AUDIO_PROFILE)
+    return profile if transcoding_available() else audio_profiles.PROFILES["original"]
+
+def audio_format(audio_id: str, requested: Optional[str] = None, accepted: Optional[str] = None) -> Optional[str]:
+    """
+    The ?format= for an audio URL handed to a client, or None for the bare URL. Each URL names
+    one representation: the bare URL is the clip as synthesized (streamed while in flight) and
+    ?format= a transcoded profile. A clip still in flight gets the bare URL unless the caller
+    asked for a profile, so playback starts at once. ValueError for an unknown name.
+    """
+    profile = audio_profile(requested, accepted)
+    if not profile.ffmpeg_args:
+        return None
+    explicit = bool((requested or "").strip()) or accepted in audio_profiles.OGG_MIMETYPES
+    clip = _clips.get(audio_id)
+    return profile.name if explicit or clip is None or clip.done else None
+
+def encode_audio(audio_id: str, audio_bytes: bytes, profile: AudioProfile) -> Tuple[bytes, AudioProfile]:
+    """
+    (bytes, profile) for a finished clip in `profile`, transcoded in the process pool and cached
+    next to the clip. A failed transcode logs and returns the original MP3.
+    """
+    if not profile.ffmpeg_args:
+        return audio_bytes, profile
+    key = audio_key(audio_id, profile.name)
+    encoded = _cache.get(key)
+    if encoded is None:
+        try:
+            with stage("transcode"):
+                encoded = _transcode_pool.run(audio_profiles.transcode, audio_bytes, profile.ffmpeg_args,
+                                              AUDIO_FFMPEG, AUDIO_TRANSCODE_TIMEOUT)
+        except Exception:
+            log.exception("Transcoding to '%s' failed; serving the original MP3", profile.name)
+            return audio_bytes, audio_profiles.PROFILES["original"]
+        _cache.put(key, encoded)
+    metrics.encoded_bytes.observe(len(encoded), profile=profile.name)
+    return encoded, profile
 
 def tts_available() -> bool:
-    """Return True if gTTS is importable and ENABLE_TTS != 0."""
+    """
+    Return True if the TTS backend is installed, ENABLE_TTS != 0 and its breaker isn't open
+    (gtts itself is imported on first synthesis).
+    """
     if os.getenv("ENABLE_TTS", "1") == "0":
         return False
-    try:
-        import gtts  # noqa: F401
-        return True
-    except Exception:
-        return False
+    return synthesizer.available() and tts_policy.breaker.available()
+
+@lru_cache(maxsize=1)
+def _gtts_installed() -> bool:
+    return importlib.util.find_spec("gtts") is not None
 
-def _synthesize_mp3_bytes(text: str) -> bytes:
-    """Synthesize MP3 bytes in-memory using gTTS (no disk I/O)."""
+# --- Background synthesis for /api/audio/<id> ---
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TTS_WORKERS", "4")), thread_name_prefix="tts")
+_clips = AudioStore(max_clips=int(os.getenv("TTS_MAX_CLIPS", "64")))
+# A clip followed from another worker's .part file fails once the file stops growing for this long.
+TTS_PARTIAL_STALL_SECONDS = float(os.getenv("TTS_PARTIAL_STALL_SECONDS", "60"))
+
+# --- Chunked synthesis: chunks of one story are synthesized concurrently on a shared, bounded pool ---
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "400"))
+_chunk_pool = ThreadPoolExecutor(max_workers=int(os.getenv("TTS_CHUNK_WORKERS", "4")), thread_name_prefix="tts-chunk")
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"”’])\s+")
+
+def _make_gtts(text: str, lang: str = "en"):
+    """A gTTS object, used only to tokenize and package the text; GTTSTransport sends its requests."""
     from gtts import gTTS
-    buf = BytesIO()
-    gTTS(text=text, lang="en").write_to_fp(buf)
-    return buf.getvalue()
+    return gTTS(text=text, lang=lang)
+
+def _synthesize_mp3_bytes(text: str, lang: str = "en") -> bytes:
+    """Synthesize MP3 bytes in-memory with the configured backend (no disk I/O)."""
+    with stage("tts"):
+        audio_bytes = tts_policy.call(lambda timeout: synthesizer.synthesize(text, lang=lang, timeout=timeout))
+    metrics.audio_bytes.observe(len(audio_bytes), backend=synthesizer.name)
+    metrics.observe_tts_chars(len(text))
+    return audio_bytes
+
+def split_for_tts(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """
+    Split text into TTS chunks on paragraph boundaries, packing whole sentences up to max_chars.
+    Chunks never span paragraphs, so an edit to one paragraph leaves the others' chunks unchanged.
+    """
+    chunks: List[str] = []
+    for para in re.split(r"\n\s*\n|\n", text or ""):
+        para = para.strip()
+        if not para:
+            continue
+        current = ""
+        for sentence in _SENTENCE_BREAK.split(para):
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+def synthesize_mp3(text: str, voice: Optional[str] = None, lang: str = "en") -> bytes:
+    """Return MP3 bytes for text, served from the audio cache when the same clip was made before."""
+    key = audio_key(text, lang, voice)
+    audio_bytes = _cache.get(key)
+    if audio_bytes is None:
+        metrics.tts_chunks.inc(source="synth")
+        audio_bytes = _synthesize_mp3_bytes(text, lang=lang)
+        _cache.put(key, audio_bytes)
+    else:
+        metrics.tts_chunks.inc(source="cache")
+    return audio_bytes
 
-def synthesize_to_data_url(text: str, voice: Optional[str] = None) -> Optional[str]:
+def iter_mp3_chunks(text: str, voice: Optional[str] = None, lang: str = "en") -> Iterator[bytes]:
+    """
+    Synthesize the chunks of text in parallel and yield their MP3 bytes in story order;
+    the first chunk is yielded as soon as it is ready. MP3 frames concatenate cleanly.
     """
-    Return a data URL: data:audio/mpeg;base64,<...>
+    # Each chunk runs in a copy of the caller's context, so its stage timing and usage are attributed.
+    futures = [_chunk_pool.submit(contextvars.copy_context().run, synthesize_mp3, chunk, voice, lang)
+               for chunk in split_for_tts(text)]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+def synthesize_story_mp3(text: str, voice: Optional[str] = None, lang: str = "en") -> bytes:
+    """Whole-story MP3 via chunked parallel synthesis, cached under the full text's key."""
+    key = audio_key(text, lang, voice)
+    audio_bytes = _cache.get(key)
+    if audio_bytes is None:
+        audio_bytes = b"".join(iter_mp3_chunks(text, voice=voice, lang=lang))
+        _cache.put(key, audio_bytes)
+    return audio_bytes
+
+def tts_cache_stats() -> dict:
+    return _cache.stats()
+
+def synthesize_to_data_url(text: str, voice: Optional[str] = None, profile: Optional[AudioProfile] = None) -> Optional[str]:
+    """
+    Return a data URL: data:audio/mpeg;base64,<...> (or audio/ogg for the opus profile).
     Keeps Serverless-friendly & Render-friendly (no filesystem writes).
     """
     if os.getenv("ENABLE_TTS", "1") == "0":
         return None
     if not tts_available():
         return None
-    audio_bytes = _synthesize_mp3_bytes(text)
+    audio_bytes = synthesize_story_mp3(text, voice=voice)
+    audio_bytes, profile = encode_audio(audio_key(text, "en", voice), audio_bytes, profile or audio_profile())
     b64 = base64.b64encode(audio_bytes).decode("ascii")
-    return f"data:audio/mpeg;base64,{b64}"
+    return f"data:{profile.mimetype};base64,{b64}"
+
+def _run_synthesis(clip: AudioClip, key: str, text: str, voice: Optional[str], lang: str) -> None:
+    try:
+        for chunk in iter_mp3_chunks(text, voice=voice, lang=lang):
+            clip.write(chunk)
+            _cache.partial_append(key, chunk)
+        _cache.put(key, clip.getvalue())
+        clip.close()
+    except Exception as e:
+        log.exception("Background TTS failed")
+        clip.fail(e)
+    finally:
+        _cache.partial_discard(key)
+
+def start_synthesis(text: str, voice: Optional[str] = None, lang: str = "en") -> Optional[str]:
+    """
+    Begin synthesizing text in the background and return its audio id (the content hash),
+    to be served from /api/audio/<id> while it is still being produced. None when TTS is off.
+    """
+    if not tts_available():
+        return None
+    key = audio_key(text, lang, voice)
+    clip, created = _clips.get_or_create(key)
+    if created:
+        cached = _cache.get(key)
+        if cached is not None:
+            clip.write(cached)
+            clip.close()
+        else:
+            _cache.partial_start(key)  # before the id is handed out, so every worker can follow it
+            _executor.submit(contextvars.copy_context().run, _run_synthesis, clip, key, text, voice, lang)
+    return key
+
+def publish_audio(text: str, audio_bytes: bytes, voice: Optional[str] = None, lang: str = "en") -> str:
+    """Register already-synthesized audio for text (e.g. from the story pool) and return its audio id."""
+    key = audio_key(text, lang, voice)
+    clip, created = _clips.get_or_create(key)
+    if created:
+        clip.write(audio_bytes)
+        clip.close()
+    return key
+
+def is_audio_id(audio_id: str) -> bool:
+    return re.fullmatch(r"[0-9a-f]{64}", audio_id or "") is not None
+
+def audio_shared() -> bool:
+    """
+    Whether every worker can serve every audio id. Without TTS_CACHE_DIR, a clip that is still
+    being synthesized exists only in the worker that started it.
+    """
+    return _cache.shared
+
+def open_audio(audio_id: str) -> Optional[AudioClip]:
+    """
+    Look up a clip by id: in-flight/recent clips first, then the audio cache, then a clip
+    another worker is still producing (followed through its .part file in TTS_CACHE_DIR).
+    """
+    if not is_audio_id(audio_id):
+        return None
+    clip = _clips.get(audio_id)
+    if clip is not None:
+        return clip
+    data = _cache.get(audio_id)
+    if data is not None:
+        return AudioClip.complete(data)
+    if _cache.partial_read(audio_id, 0) is None:
+        return None
+    clip, created = _clips.get_or_create(audio_id)
+    if created:
+        threading.Thread(target=_follow_partial, args=(clip, audio_id), name="tts-follow", daemon=True).start()
+    return clip
+
+def _follow_partial(clip: AudioClip, key: str) -> None:
+    """Copy another worker's in-flight clip into `clip` until its finished audio is in the cache."""
+    pos = 0
+    while True:
+        partial = _cache.partial_read(key, pos)
+        if partial is None:
+            data = _cache.get(key)  # the writer stores the clip before removing its .part file
+            if data is None:
+                clip.fail(RuntimeError("Synthesis failed in another worker."))
+            else:
+                clip.write(data[pos:])
+                clip.close()
+            return
+        data, mtime = partial
+        if data:
+            clip.write(data)
+            pos += len(data)
+        elif time.time() - mtime > TTS_PARTIAL_STALL_SECONDS:
+            _cache.partial_discard(key)  # its worker died mid-clip
+            clip.fail(RuntimeError("Synthesis stalled in another worker."))
+            return
+        time.sleep(0.1)
+
+class PipelinedSynthesis:
+    """
+    Incremental TTS for text that is still being generated. feed() streamed deltas; every
+    completed paragraph is handed to the chunk pool immediately and its audio is appended to
+    the clip in order, so synthesis overlaps the LLM pass instead of following it.
+
+    audio_id is random, since the text isn't known yet. Once the clip is finished it is also
+    published under the text's content hash (content_id), the id start_synthesis and story
+    sessions use.
+    """
+
+    def __init__(self, voice: Optional[str] = None, lang: str = "en"):
+        self.voice = voice
+        self.lang = lang
+        self.audio_id = secrets.token_hex(32)
+        self._clip, _ = _clips.get_or_create(self.audio_id)
+        _cache.partial_start(self.audio_id)
+        self._pending = ""
+        self._text: List[str] = []
+        self._futures: "queue.Queue" = queue.Queue()
+        self.content_id: Optional[str] = None
+        # Its own thread: the drain waits out the whole judge pass, which would pin a _executor slot.
+        threading.Thread(target=self._drain, name="tts-drain", daemon=True).start()
+
+    def feed(self, delta: str) -> None:
+        self._text.append(delta)
+        self._pending += delta
+        while "\n" in self._pending:
+            paragraph, self._pending = self._pending.split("\n", 1)
+            self._submit(paragraph)
+
+    def close(self) -> None:
+        self._submit(self._pending)
+        self._pending = ""
+        self._futures.put(None)
+
+    def abort(self, error: BaseException) -> None:
+        self._futures.put(error)
+
+    def _submit(self, paragraph: str) -> None:
+        for chunk in split_for_tts(paragraph):
+            self._futures.put(_chunk_pool.submit(contextvars.copy_context().run, synthesize_mp3, chunk, self.voice, self.lang))
+
+    def _drain(self) -> None:
+        try:
+            while True:
+                item = self._futures.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                chunk = item.result()
+                self._clip.write(chunk)
+                _cache.partial_append(self.audio_id, chunk)
+            audio_bytes = self._clip.getvalue()
+            _cache.put(self.audio_id, audio_bytes)
+            text = "".join(self._text).strip()
+            _cache.put(audio_key(text, self.lang, self.voice), audio_bytes)  # disk tier: other workers
+            self.content_id = publish_audio(text, audio_bytes, self.voice, self.lang)
+            self._clip.close()
+        except Exception as e:
+            log.exception("Pipelined TTS failed")
+            self._clip.fail(e)
+        finally:
+            _cache.partial_discard(self.audio_id)
+
+def start_pipelined_synthesis(voice: Optional[str] = None, lang: str = "en") -> Optional[PipelinedSynthesis]:
+    """PipelinedSynthesis whose audio_id is served by /api/audio/<id>; None when TTS is off."""
+    if not tts_available():
+        return None
+    return PipelinedSynthesis(voice=voice, lang=lang)
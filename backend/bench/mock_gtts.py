@@ -0,0 +1,78 @@
+"""
+Offline stand-in for Google Translate's TTS endpoint as used by gTTS
+(POST /_/TranslateWebserverUi/data/batchexecute). Point the backend at it with GTTS_BASE_URL.
+
+Each request answers after `latency + chars * per_char` seconds with a fake MP3 payload sized
+like real 32 kbps speech, wrapped in the batchexecute envelope gTTS parses.
+
+    python -m bench.mock_gtts --port 9002 --latency 0.15
+"""
+import re
+import json
+import time
+import base64
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler
+
+from .mock_openai import QuietHTTPServer
+
+_FRAME = bytes.fromhex("fff36400") + b"\x00" * 140  # an MPEG-2 layer III frame header + padding
+BYTES_PER_CHAR = 270
+
+def fake_mp3(chars: int) -> bytes:
+    size = max(len(_FRAME), chars * BYTES_PER_CHAR)
+    return (_FRAME * (size // len(_FRAME) + 1))[:size]
+
+class MockGTTSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.15
+    per_char = 0.0005
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+        text = ""
+        try:
+            rpc = json.loads(form["f.req"][0])
+            text = json.loads(rpc[0][0][1])[0]
+        except (KeyError, IndexError, ValueError):
+            pass
+        if not re.search(r"batchexecute$", self.path.split("?")[0]):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        time.sleep(self.latency + len(text) * self.per_char)
+        b64 = base64.b64encode(fake_mp3(len(text))).decode("ascii")
+        body = (")]}'\n\n" + f'[["wrb.fr","jQ1olc","[\\"{b64}\\"]",null,null,null,"generic"]]\n').encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve(port: int = 9002, latency: float = 0.15, per_char: float = 0.0005) -> QuietHTTPServer:
+    """Start the mock in a daemon thread and return the server (call .shutdown() to stop)."""
+    handler = type("Handler", (MockGTTSHandler,), {"latency": latency, "per_char": per_char})
+    server = QuietHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="mock-gtts", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9002)
+    parser.add_argument("--latency", type=float, default=0.15, help="seconds per request")
+    parser.add_argument("--per-char", type=float, default=0.0005, help="extra seconds per character")
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.per_char)
+    print(f"mock gTTS listening on http://127.0.0.1:{args.port}")
+    threading.Event().wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Offline stand-in for the OpenAI Chat Completions API (POST /v1/chat/completions).
+
+Replies with a synthetic ~700-word story after a configurable time-to-first-token, then
+"generates" at a fixed token rate; supports stream=True (SSE chunks, with a final usage chunk
+when stream_options.include_usage is set), n > 1 and usage.
+
+    python -m bench.mock_openai --port 9001 --profile typical
+"""
+import sys
+import time
+import json
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# (time to first token in seconds, completion tokens per second)
+PROFILES = {
+    "instant": (0.0, 0.0),
+    "fast": (0.2, 400.0),
+    "typical": (0.6, 90.0),
+    "slow": (2.0, 40.0),
+}
+
+_NAMES = ["Pip", "Luna", "Milo", "Rosa", "Theo", "Juniper"]
+_SENTENCES = [
+    "The moon peeked through the window like a curious friend.",
+    "{name} tiptoed across the soft blue rug.",
+    "A tiny breeze carried the smell of warm cookies.",
+    "Everyone giggled when the teapot started to hum.",
+    "The path curled past the sleepy garden and the whispering trees.",
+    "{name} took a deep breath and felt brave inside.",
+    "Stars blinked one by one, as if saying hello.",
+    "The little lantern glowed a gentle gold.",
+]
+
+def make_story(words: int = 700, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    name = rng.choice(_NAMES)
+    paragraphs, count = [], 0
+    while count < words:
+        lines = [rng.choice(_SENTENCES).format(name=name) for _ in range(4)]
+        lines.append(f'"What a wonderful night," said {name}.')
+        paragraph = " ".join(lines)
+        paragraphs.append(paragraph)
+        count += len(paragraph.split())
+    paragraphs.append(f"And with a cozy yawn, {name} drifted off to sleep, happy and safe.")
+    return "\n\n".join(paragraphs)
+
+def _token_chunks(text: str):
+    # Roughly one token per word piece; good enough for timing.
+    words = text.split(" ")
+    for i, w in enumerate(words):
+        yield w if i == 0 else " " + w
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ttft = 0.6
+    tokens_per_sec = 90.0
+    story_words = 700
+
+    def log_message(self, *args):  # keep benchmark output clean
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        req = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in req.get("messages", []))
+        max_tokens = int(req.get("max_tokens") or 1600)
+        n = int(req.get("n") or 1)
+        stories = [make_story(self.story_words, seed=hash((prompt_tokens, i, time.time()))) for i in range(n)]
+        tokens = [list(_token_chunks(s))[:max_tokens] for s in stories]
+        created = int(time.time())
+        time.sleep(self.ttft)
+
+        if req.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            delay = 1.0 / self.tokens_per_sec if self.tokens_per_sec else 0.0
+            for tok in tokens[0]:
+                chunk = {
+                    "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created,
+                    "model": req.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": tok}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                if delay:
+                    time.sleep(delay)
+            done = {
+                "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created,
+                "model": req.get("model"), "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            self._write_chunk(f"data: {json.dumps(done)}\n\n")
+            if (req.get("stream_options") or {}).get("include_usage"):
+                usage = {
+                    "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created,
+                    "model": req.get("model"), "choices": [],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens[0]),
+                              "total_tokens": prompt_tokens + len(tokens[0])},
+                }
+                self._write_chunk(f"data: {json.dumps(usage)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("")
+            return
+
+        if self.tokens_per_sec:
+            time.sleep(max(len(t) for t in tokens) / self.tokens_per_sec)
+        completion_tokens = sum(len(t) for t in tokens)
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": created,
+            "model": req.get("model"),
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": "".join(t)}, "finish_reason": "stop"}
+                for i, t in enumerate(tokens)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _write_chunk(self, data: str) -> None:
+        raw = data.encode("utf-8")
+        self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """Threaded server that doesn't print tracebacks for clients hanging up mid-response."""
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+def serve(port: int = 9001, profile: str = "typical", ttft=None, tokens_per_sec=None, story_words: int = 700) -> QuietHTTPServer:
+    """Start the mock in a daemon thread and return the server (call .shutdown() to stop)."""
+    base_ttft, base_rate = PROFILES[profile]
+    handler = type("Handler", (MockOpenAIHandler,), {
+        "ttft": base_ttft if ttft is None else ttft,
+        "tokens_per_sec": base_rate if tokens_per_sec is None else tokens_per_sec,
+        "story_words": story_words,
+    })
+    server = QuietHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="typical")
+    parser.add_argument("--ttft", type=float, default=None, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=None, help="0 = unlimited")
+    parser.add_argument("--story-words", type=int, default=700)
+    args = parser.parse_args()
+    serve(args.port, args.profile, args.ttft, args.tokens_per_sec, args.story_words)
+    print(f"mock OpenAI listening on http://127.0.0.1:{args.port}/v1")
+    threading.Event().wait()
+
+if __name__ == "__main__":
+    main()
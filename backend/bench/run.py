@@ -0,0 +1,328 @@
+"""
+Offline load benchmark for the backend.
+
+Starts the mock OpenAI and mock gTTS servers, runs the app under gunicorn with the given
+worker settings (pointed at the mocks via OPENAI_BASE_URL / GTTS_BASE_URL), replays a
+weighted mix of requests and reports p50/p95/p99 latency, RPS and peak RSS per worker.
+No network access or API key is needed.
+
+    cd backend
+    python -m bench.run --workers 2 --threads 8 --concurrency 16 --requests 200
+    python -m bench.run --mix generate=1 --llm-profile slow --env TTS_PIPELINE=0
+    python -m bench.run --app api.asgi:app --worker-class uvicorn.workers.UvicornWorker
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from . import mock_gtts, mock_openai
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROMPTS = [
+    "",
+    "a story about a dragon who is scared of the dark",
+    "a sleepy cat who wants to visit the moon",
+    "two friends who find a treasure map in the garden",
+    "a silly ghost who loves pancakes",
+]
+CATEGORIES = [None, "Magic Adventure", "Funny", "Space Adventure", "Boo!"]
+BRACKETS = ["young", "middle", "older"]
+SAMPLE_STORY = mock_openai.make_story(700, seed=42)
+HEALTH_PROBE_LIMIT_MS = 500  # the concurrency check's bound on /api/health p95 under load
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name}'. Choose from: {', '.join(OPERATIONS)}")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+# --- Operations: each returns (latencies by label, audio URL to fetch or None) ---
+def op_generate(session: requests.Session, base: str, rng: random.Random):
+    payload = {"ageBracket": rng.choice(BRACKETS), "prompt": rng.choice(PROMPTS), "category": rng.choice(CATEGORIES)}
+    t0 = time.perf_counter()
+    r = session.post(f"{base}/api/generate", json=payload, timeout=180)
+    r.raise_for_status()
+    return {"generate": time.perf_counter() - t0}, r.json().get("audioUrl")
+
+def op_stream(session: requests.Session, base: str, rng: random.Random):
+    payload = {"ageBracket": rng.choice(BRACKETS), "prompt": rng.choice(PROMPTS), "category": rng.choice(CATEGORIES)}
+    t0 = time.perf_counter()
+    first_delta, audio_url, event = None, None, None
+    with session.post(f"{base}/api/generate/stream", json=payload, stream=True, timeout=180) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[7:]
+                if event == "delta" and first_delta is None:
+                    first_delta = time.perf_counter() - t0
+            elif line.startswith("data: ") and event == "done":
+                audio_url = json.loads(line[6:]).get("audioUrl")
+            elif line.startswith("data: ") and event == "error":
+                raise RuntimeError(json.loads(line[6:]).get("error"))
+    timings = {"stream": time.perf_counter() - t0}
+    if first_delta is not None:
+        timings["stream:first-delta"] = first_delta
+    return timings, audio_url
+
+def op_revise(session: requests.Session, base: str, rng: random.Random):
+    payload = {"story": SAMPLE_STORY, "feedback": rng.choice(["Make it sillier.", "Change the cat's name to Luna.", ""])}
+    t0 = time.perf_counter()
+    r = session.post(f"{base}/api/revise", json=payload, timeout=180)
+    r.raise_for_status()
+    return {"revise": time.perf_counter() - t0}, r.json().get("audioUrl")
+
+def op_categories(session: requests.Session, base: str, rng: random.Random):
+    t0 = time.perf_counter()
+    session.get(f"{base}/api/categories", timeout=30).raise_for_status()
+    return {"categories": time.perf_counter() - t0}, None
+
+OPERATIONS = {
+    "generate": op_generate,
+    "stream": op_stream,
+    "revise": op_revise,
+    "categories": op_categories,
+}
+
+def fetch_audio(session: requests.Session, url: str) -> Dict[str, float]:
+    t0 = time.perf_counter()
+    with session.get(url, stream=True, timeout=180) as r:
+        r.raise_for_status()
+        first = None
+        for chunk in r.iter_content(chunk_size=16384):
+            if chunk and first is None:
+                first = time.perf_counter() - t0
+    return {"audio": time.perf_counter() - t0, "audio:first-byte": first or 0.0}
+
+def probe_health(base: str, stop: threading.Event, latencies: Dict[str, List[float]], lock: threading.Lock) -> None:
+    """
+    Concurrency check: time GET /api/health every half second while the load runs. It should stay
+    in the milliseconds; seconds mean requests are being served one at a time behind slow ones.
+    """
+    session = requests.Session()
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            session.get(f"{base}/api/health", timeout=60).raise_for_status()
+        except requests.RequestException:
+            pass
+        else:
+            with lock:
+                latencies["health-probe"].append(time.perf_counter() - t0)
+        stop.wait(0.5)
+
+# --- Process & memory ---
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+def _rss_mib(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+def sample_memory(master_pid: int, stop: threading.Event, peaks: Dict[int, float]) -> None:
+    while not stop.is_set():
+        for pid in _children(master_pid):
+            rss = _rss_mib(pid)
+            if rss is not None:
+                peaks[pid] = max(peaks.get(pid, 0.0), rss)
+        stop.wait(0.5)
+
+def start_app(args, port: int, env: dict) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "gunicorn",
+        "-k", args.worker_class, "-w", str(args.workers), "--threads", str(args.threads),
+        "-t", "120", "-b", f"127.0.0.1:{port}", "--log-level", "warning", args.app,
+    ]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {proc.returncode}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/api/health", timeout=1).ok:
+                return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("gunicorn did not become healthy within 30s")
+
+# --- Load loop ---
+def run_load(base: str, mix, total: int, duration: float, concurrency: int, audio: bool, seed: int):
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.time() + duration if duration else None
+    names = [n for n, _ in mix]
+    weights = [w for _, w in mix]
+
+    def worker(idx: int) -> None:
+        rng = random.Random(seed + idx)
+        session = requests.Session()
+        while True:
+            with lock:
+                if (total and issued[0] >= total) or (deadline and time.time() >= deadline):
+                    return
+                issued[0] += 1
+            name = rng.choices(names, weights)[0]
+            try:
+                timings, audio_url = OPERATIONS[name](session, base, rng)
+                if audio and audio_url:
+                    timings.update(fetch_audio(session, audio_url))
+            except Exception:
+                with lock:
+                    errors[name] += 1
+                continue
+            with lock:
+                for label, value in timings.items():
+                    latencies[label].append(value)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    probe_stop = threading.Event()
+    probe = threading.Thread(target=probe_health, args=(base, probe_stop, latencies, lock), daemon=True)
+    t0 = time.perf_counter()
+    probe.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    probe_stop.set()
+    probe.join()
+    return latencies, errors, elapsed
+
+def summarize(latencies, errors, elapsed: float, peaks: Dict[int, float]) -> dict:
+    completed = sum(len(v) for k, v in latencies.items() if ":" not in k and k not in ("audio", "health-probe"))
+    summary = {"elapsed_s": round(elapsed, 3), "completed": completed, "rps": round(completed / elapsed, 2) if elapsed else 0.0,
+               "errors": dict(errors), "endpoints": {}, "peak_rss_mib": {str(pid): round(v, 1) for pid, v in sorted(peaks.items())}}
+    for label, values in sorted(latencies.items()):
+        values = sorted(values)
+        summary["endpoints"][label] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1),
+        }
+    return summary
+
+def print_summary(summary: dict) -> None:
+    print(f"\ncompleted {summary['completed']} requests in {summary['elapsed_s']}s  ->  {summary['rps']} req/s")
+    if summary["errors"]:
+        print(f"errors: {summary['errors']}")
+    print(f"\n{'endpoint':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, s in summary["endpoints"].items():
+        print(f"{label:<22}{s['count']:>7}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    probe = summary["endpoints"].get("health-probe")
+    if probe and probe["p95_ms"] > HEALTH_PROBE_LIMIT_MS:
+        print(f"\nWARNING: /api/health p95 {probe['p95_ms']} ms under load (limit {HEALTH_PROBE_LIMIT_MS} ms): "
+              "requests are queueing behind each other instead of running concurrently")
+    if summary["peak_rss_mib"]:
+        print("\npeak RSS per worker (MiB): " + ", ".join(f"{pid}={v}" for pid, v in summary["peak_rss_mib"].items()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="api.app:app")
+    parser.add_argument("--worker-class", default="gthread")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent client connections")
+    parser.add_argument("--requests", type=int, default=200, help="total requests (0 = use --duration)")
+    parser.add_argument("--duration", type=float, default=0.0, help="seconds to run when --requests is 0")
+    parser.add_argument("--mix", default="generate=6,revise=3,categories=1",
+                        help="weighted operations: " + ", ".join(OPERATIONS))
+    parser.add_argument("--llm-profile", choices=sorted(mock_openai.PROFILES), default="typical")
+    parser.add_argument("--llm-ttft", type=float, default=None)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=None)
+    parser.add_argument("--tts-latency", type=float, default=0.15)
+    parser.add_argument("--tts-per-char", type=float, default=0.0005)
+    parser.add_argument("--no-audio", action="store_true", help="skip fetching /api/audio URLs")
+    parser.add_argument("--no-tts", action="store_true", help="run the app with ENABLE_TTS=0")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app env (repeatable)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="also write the summary as JSON")
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    oai_port, tts_port, app_port = _free_port(), _free_port(), _free_port()
+    oai = mock_openai.serve(oai_port, args.llm_profile, args.llm_ttft, args.llm_tokens_per_sec)
+    tts = mock_gtts.serve(tts_port, args.tts_latency, args.tts_per_char)
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{oai_port}/v1",
+        "GTTS_BASE_URL": f"http://127.0.0.1:{tts_port}",
+        "ENABLE_TTS": "0" if args.no_tts else "1",
+        "LOG_LEVEL": "WARNING",
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    proc = start_app(args, app_port, env)
+    peaks: Dict[int, float] = {}
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_memory, args=(proc.pid, stop, peaks), daemon=True)
+    sampler.start()
+    try:
+        print(f"benchmarking {args.app} ({args.worker_class}, -w {args.workers} --threads {args.threads}) "
+              f"with {args.concurrency} clients, mix {args.mix}, LLM profile {args.llm_profile}")
+        latencies, errors, elapsed = run_load(
+            f"http://127.0.0.1:{app_port}", mix, args.requests, args.duration,
+            args.concurrency, not args.no_audio, args.seed,
+        )
+    finally:
+        stop.set()
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:  # a worker stuck mid-request; still print what was measured
+            proc.kill()
+            proc.wait()
+        oai.shutdown()
+        tts.shutdown()
+
+    summary = summarize(latencies, errors, elapsed, peaks)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,15 @@
 import os
-from openai import OpenAI
+import sys
+import json
+import argparse
 import random
 from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
-
-# --- Category Definitions ---
-CATEGORIES = {
-    "magic_adventure": "Magic Adventure",
-    "epic_quest": "Epic Quest",
-    "mystery": "Mystery",
-    "funny": "Funny",
-    "friends_and_family": "Friends and Family",
-    "furry_friends": "Furry Friends",
-    "space_adventure": "Space Adventure",
-    "boo": "Boo!"
-}
-
-# --- External Inspiration Resources ---
-INSPIRATION_SITES = [
-    "https://www.storyberries.com",
-    "https://www.sleepystories.net",
-    "https://www.freechildrenstories.com",
-    "https://www.bedtimestory.ai"
-]
-
-# --- Utility Functions ---
-def detect_category(user_input: str) -> str:
-    """Infer category based on keywords in user input."""
-    mapping = {
-        "magic_adventure": ["wizard", "magic", "castle", "fairy", "dragon"],
-        "epic_quest": ["journey", "quest", "explore", "map", "treasure"],
-        "mystery": ["mystery", "secret", "clue", "detective", "case"],
-        "funny": ["funny", "silly", "laugh", "joke", "goofy"],
-        "friends_and_family": ["family", "friend", "home", "siblings", "school"],
-        "furry_friends": ["cat", "dog", "rabbit", "animal", "pet"],
-        "space_adventure": ["space", "planet", "rocket", "alien", "moon"],
-        "boo": ["ghost", "spooky", "monster", "witch", "boo"]
-    }
-    input_lower = user_input.lower()
-    for cat, keywords in mapping.items():
-        if any(word in input_lower for word in keywords):
-            return CATEGORIES[cat]
-    return random.choice(list(CATEGORIES.values()))
+# Categories, prompts and the shared OpenAI client come from the API's story engine.
+from api.story_engine import CATEGORIES, GENERATION_STRATEGIES, generate_story_strategy, revise_story_api
 
 
 def determine_age_bracket(age: int) -> str:
@@ -56,75 +21,13 @@ def determine_age_bracket(age: int) -> str:
         return "older"
 
 
-def call_model(messages, temperature=0.7, max_tokens=1600):
-    client = OpenAI(
-        api_key=os.environ.get("OPENAI_API_KEY"),
-    )
-    resp = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
-    return resp.choices[0].message.content.strip()
-
-# --- Story Generation Logic ---
-def build_storyteller_prompt(user_request: str, category: str, age_bracket: str) -> list:
-    system_message = f"""
-You are a creative children's storyteller. 
-Use inspiration from well-written stories on trusted children's sites like: {', '.join(INSPIRATION_SITES)}.
-
-The child is in the {age_bracket} age bracket (5-10 years old).
-Category: {category}
-
-Guidelines:
-- Write a story with a clear beginning, middle, and happy ending.
-- Include a gentle conflict or challenge suitable for a child.
-- Use age-appropriate, vivid, and engaging language.
-- Include positive values or a small moral.
-- Aim for 500-1000 words. Prioritize elaboration over brevity.
-- Keep it safe and appropriate: no scary, violent, or mature content.
-- Be imaginative, unique, and draw subtle inspiration from the mentioned sources without copying.
-    """
-    return [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": user_request}
-    ]
-
-
-def build_judge_prompt(story: str, user_feedback: Optional[str] = None) -> list:
-    critique_instruction = f"""
-You are a children's story judge. Improve this story by checking for:
-- Structure (beginning-middle-end)
-- Clarity and engagement
-- Age-appropriate language
-- Gentle tone and moral
-- Remove anything inappropriate
-- Ensure it's closer to 500-1000 words if too short
-- Take creative inspiration from sites like: {', '.join(INSPIRATION_SITES)}
-"""
-    if user_feedback:
-        critique_instruction += f"\nAlso apply this user feedback: {user_feedback}\n"
-    return [
-        {"role": "system", "content": critique_instruction},
-        {"role": "user", "content": story}
-    ]
-
-
 def generate_story(user_request: str, age: int, category: Optional[str] = None) -> str:
-    chosen_category = category or detect_category(user_request)
-    age_bracket = determine_age_bracket(age)
-    storyteller_prompt = build_storyteller_prompt(user_request, chosen_category, age_bracket)
-    raw_story = call_model(storyteller_prompt, temperature=0.85, max_tokens=1600)
-    judge_prompt = build_judge_prompt(raw_story)
-    final_story = call_model(judge_prompt, temperature=0.65, max_tokens=1600)
+    final_story, _, _ = generate_story_strategy(user_request, determine_age_bracket(age), category)
     return final_story
 
 
 def revise_story_from_interrupt(current_story: str, interrupt_point: str, user_feedback: str) -> str:
-    revision_prompt = build_judge_prompt(current_story, user_feedback=user_feedback)
-    revised_story = call_model(revision_prompt, temperature=0.65, max_tokens=1600)
-    return revised_story
+    return revise_story_api(current_story, user_feedback=user_feedback)
 
 
 # --- Main CLI entry ---
@@ -149,5 +52,73 @@ def main():
     print(final_story)
 
 
+# --- Batch CLI: python main.py batch jobs.jsonl --out packs/boo ---
+def load_jobs_file(path: str) -> list:
+    """A JSON list, or JSON Lines, of {"prompt", "category", "ageBracket", "count"} objects."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def batch_main(argv) -> int:
+    parser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Generate a story pack into OUT (stories.jsonl + audio/*.mp3). "
+                    "Re-run with the same --out to resume an interrupted batch.",
+    )
+    parser.add_argument("jobs", nargs="?", help="JSON or JSONL file of {prompt, category, ageBracket, count}")
+    parser.add_argument("--out", required=True, help="run directory (created if missing)")
+    parser.add_argument("--prompt", default="", help="single job: story prompt")
+    parser.add_argument("--category", help="single job: category, e.g. 'Boo!'")
+    parser.add_argument("--age-bracket", default="middle", choices=["young", "middle", "older"])
+    parser.add_argument("--count", type=int, default=1, help="single job: number of stories")
+    parser.add_argument("--strategy", default="two-pass", choices=GENERATION_STRATEGIES)
+    parser.add_argument("--workers", type=int, default=4, help="parallel story generations")
+    parser.add_argument("--tts-workers", type=int, default=2, help="parallel narrations")
+    parser.add_argument("--no-audio", action="store_true", help="skip MP3 narration")
+    args = parser.parse_args(argv)
+
+    from api.batch import BatchRun, JOBS_FILE, normalize_jobs
+    from api.tts_engine import synthesize_story_mp3, tts_available
+
+    if args.jobs:
+        jobs = normalize_jobs(load_jobs_file(args.jobs))
+    elif args.category or args.prompt:
+        jobs = normalize_jobs([{"prompt": args.prompt, "category": args.category,
+                                "ageBracket": args.age_bracket, "count": args.count}])
+    elif os.path.exists(os.path.join(args.out, JOBS_FILE)):
+        jobs = None  # resume with the saved job list
+    else:
+        parser.error("give a jobs file, --category/--prompt, or an existing --out to resume")
+
+    run = BatchRun(
+        args.out, jobs, strategy=args.strategy, llm_workers=args.workers, tts_workers=args.tts_workers,
+        audio=not args.no_audio, synthesize=synthesize_story_mp3 if tts_available() else None,
+    )
+    total = len(run.jobs)
+    already = run.status()["completed"]
+    print(f"{total} stories, {already} already done -> {args.out}")
+    progress = {"done": already}
+
+    def report(record: dict) -> None:
+        progress["done"] += 1
+        audio = record.get("audioFile") or "no audio"
+        print(f"[{progress['done']}/{total}] {record['id']} {record['category']} ({record['words']} words, {audio})")
+
+    try:
+        status = run.run(on_progress=report)
+    except KeyboardInterrupt:
+        print("\nInterrupted; re-run the same command to resume.")
+        return 130
+    for job_id, error in status["errors"].items():
+        print(f"failed {job_id}: {error}", file=sys.stderr)
+    print(f"{status['completed']}/{total} done")
+    return 0 if status["completed"] == total else 1
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(batch_main(sys.argv[2:]))
     main()
@@ -14,13 +14,17 @@ const api = axios.create({
   baseURL: API_BASE,         // e.g. https://your-backend.vercel.app
   withCredentials: false
 })
+// Ask for the compact narration profile (speech = mono 24 kbps MP3); without it the backend links the
+// clip as synthesized whenever it is still being generated. Set VITE_AUDIO_FORMAT=original to opt out.
+const AUDIO_FORMAT = import.meta.env.VITE_AUDIO_FORMAT || 'speech'
 
 export default function App() {
   const [ageBracket, setAgeBracket] = useState(null)
   const [categories, setCategories] = useState([])
   const [story, setStory] = useState('')
   const [audioUrl, setAudioUrl] = useState(null)
-  const [_categoryPicked, setCategoryPicked] = useState(null)
+  const [storyId, setStoryId] = useState(null)
+  const [categoryPicked, setCategoryPicked] = useState(null)
   const [promptOpen, setPromptOpen] = useState(false)
   const [promptText, setPromptText] = useState('')
   const [toast, setToast] = useState(null)
@@ -40,9 +44,11 @@ export default function App() {
       const { data } = await api.post('/api/generate', {
         ageBracket: ageBracket || 'middle',
         category,
-        prompt
+        prompt,
+        audioFormat: AUDIO_FORMAT
       })
       setStory(data.story)
+      setStoryId(data.storyId || null)
       setCategoryPicked(data.category)
       setAudioUrl(data.audioUrl || null)
       setToast({ type: 'success', msg: `Story ready: ${data.category}` })
@@ -58,8 +64,15 @@ export default function App() {
   const applyEdit = async (feedback) => {
     try {
       setControlsDisabled(true)
-      const { data } = await api.post('/api/revise', { story, feedback })
+      // The server keeps the story under storyId; the full text is only re-sent if that session expired.
+      const fullStory = { story, feedback, category: categoryPicked, ageBracket, audioFormat: AUDIO_FORMAT }
+      const { data } = await api.post('/api/revise', storyId ? { storyId, feedback, audioFormat: AUDIO_FORMAT } : fullStory)
+        .catch(e => {
+          if (!storyId || e?.response?.status !== 404) throw e
+          return api.post('/api/revise', fullStory)
+        })
       setStory(data.story)
+      setStoryId(data.storyId || null)
       setAudioUrl(data.audioUrl || null)
       setToast({ type: 'success', msg: 'Story updated' })
     } catch (e) {